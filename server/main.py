@@ -1,30 +1,68 @@
+import os
+from contextlib import asynccontextmanager
+import psycopg2
+from psycopg2.pool import PoolError
 from fastapi import FastAPI
 from dotenv import load_dotenv
 
+# Load before importing routers so module-level settings see the .env values
+load_dotenv()
+
 from routers.market import router as market_router
 from routers.earnings import router as earnings_router
 from routers.stock import router as stock_router
 from routers.cron import router as cron_router
 from routers.stock_options import router as option_router
+from routers.stats import router as stats_router
+from utils import database, market_overview
+from utils.migrations import migrate, verify_indexes
+from utils.responses import FastJSONResponse
 
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from starlette.middleware.gzip import DEFAULT_EXCLUDED_CONTENT_TYPES
 
-load_dotenv()
+# Responses smaller than this many bytes are sent uncompressed
+GZIP_MINIMUM_SIZE = int(os.getenv("GZIP_MINIMUM_SIZE", 1000))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+	try:
+		database.init_pool()
+		with database.pooled_connection() as conn:
+			migrate(conn)
+			verify_indexes(conn)
+	except (psycopg2.OperationalError, PoolError) as e:
+		# Database unreachable, requests retry creating the pool so non-database routes keep working
+		print(f"Failed to prepare database: {e}")
+	except Exception as e:
+		# The database is up but a migration failed or indexes are missing, don't serve a half-migrated schema
+		print(f"Refusing to start: {e}")
+		database.close_pool()
+		raise
+	market_overview.start()
+	yield
+	await market_overview.stop()
+	database.close_pool()
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
 
 app.include_router(market_router, prefix="/api")
 app.include_router(earnings_router, prefix="/api")
 app.include_router(stock_router, prefix="/api")
 app.include_router(cron_router, prefix="/api")
 app.include_router(option_router, prefix="/api")
+app.include_router(stats_router, prefix="/api")
 # app.include_router(foodi_router, prefix="/api")
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["https://chinny.net", "https://www.chinny.net", "http://localhost:3000"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor"],
 )
+# Streamed NDJSON stays uncompressed, gzip would hold lines back until its buffer fills
+app.add_middleware(GZipMiddleware, minimum_size=GZIP_MINIMUM_SIZE, exclude_content_types=DEFAULT_EXCLUDED_CONTENT_TYPES + ("application/x-ndjson",))
 
 
 @app.get("/")
@@ -0,0 +1,38 @@
+-- Tables the server reads and writes. IF NOT EXISTS keeps this safe on databases
+-- that were set up before migrations existed.
+
+CREATE TABLE IF NOT EXISTS earnings (
+	ticker TEXT NOT NULL,
+	earnings_date DATE NOT NULL,
+	earnings_timing TEXT NOT NULL,
+	expected_move DOUBLE PRECISION,
+	avg_volume DOUBLE PRECISION,
+	iv30_rv30 DOUBLE PRECISION,
+	ts_slope DOUBLE PRECISION,
+	eps_estimate DOUBLE PRECISION,
+	rating INTEGER
+);
+
+-- Older tables may hold duplicate tickers, keep the one with the latest earnings_date
+-- (an arbitrary one of them when several share it)
+DELETE FROM earnings a USING earnings b
+WHERE a.ticker = b.ticker AND (a.earnings_date, a.ctid) < (b.earnings_date, b.ctid);
+
+-- The ingestion upsert (ON CONFLICT (ticker)) depends on this
+CREATE UNIQUE INDEX IF NOT EXISTS earnings_ticker_key ON earnings (ticker);
+
+CREATE TABLE IF NOT EXISTS company_metadata (
+	ticker TEXT PRIMARY KEY,
+	market_cap DOUBLE PRECISION,
+	name TEXT,
+	sector TEXT,
+	updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS prediction_cache (
+	ticker TEXT NOT NULL,
+	session_date DATE NOT NULL,
+	payload JSONB NOT NULL,
+	as_of TIMESTAMPTZ NOT NULL DEFAULT now(),
+	PRIMARY KEY (ticker, session_date)
+);
@@ -0,0 +1,7 @@
+-- Cleanup deletes (earnings_date < CURRENT_DATE, earnings_date = CURRENT_DATE AND
+-- earnings_timing = 'bmo') and GET /earnings date/timing filters
+CREATE INDEX IF NOT EXISTS earnings_date_timing_idx ON earnings (earnings_date, earnings_timing);
+
+-- Keyset pages of GET /earnings sorted by date or rating
+CREATE INDEX IF NOT EXISTS earnings_date_ticker_idx ON earnings (earnings_date, ticker);
+CREATE INDEX IF NOT EXISTS earnings_rating_ticker_idx ON earnings (rating, ticker);
@@ -0,0 +1,2 @@
+-- When each earnings row was last computed, so ingestion can skip fresh, unchanged entries
+ALTER TABLE earnings ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT now();
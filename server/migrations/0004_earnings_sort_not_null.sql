@@ -0,0 +1,8 @@
+-- GET /earnings pages with (sort column, ticker) row comparisons, which never match
+-- NULLs. Ingestion always writes these columns, so rows missing them are leftovers.
+DELETE FROM earnings WHERE ticker IS NULL OR earnings_date IS NULL OR earnings_timing IS NULL OR rating IS NULL;
+
+ALTER TABLE earnings ALTER COLUMN ticker SET NOT NULL;
+ALTER TABLE earnings ALTER COLUMN earnings_date SET NOT NULL;
+ALTER TABLE earnings ALTER COLUMN earnings_timing SET NOT NULL;
+ALTER TABLE earnings ALTER COLUMN rating SET NOT NULL;
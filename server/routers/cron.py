@@ -1,5 +1,7 @@
 from fastapi import APIRouter, Request, Depends, HTTPException
 from utils.database import get_db
+from utils.executor import run_upstream
+from utils.prediction_cache import purge_sessions_before, trading_session
 import routers.earnings as re
 
 router = APIRouter()
@@ -12,6 +14,8 @@ async def cron_job_fetch_earnings(request: Request, db=Depends(get_db)):
 	await re.delete_week_old_earnings(db)
 	
 	await re.post_next_week_earnings(db)
+
+	await run_upstream("database", purge_sessions_before, db, trading_session())
 	
 	return {"status": "Cron completed: Updated earnings table"}
 
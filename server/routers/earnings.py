@@ -1,107 +1,231 @@
-import yfinance as yf
+import os
 import math
+import base64
+import orjson
+from datetime import date, datetime, timedelta, timezone
+from typing import Annotated
 from dotenv import load_dotenv
-from fastapi import APIRouter, Depends, HTTPException
-from psycopg2.extras import RealDictCursor
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from psycopg2.extras import RealDictCursor, execute_values
 from utils.database import get_db
-from utils.earnings import get_earnings_calendar, compute_recommendation
+from utils.earnings import get_earnings_calendar, compute_recommendations
+from utils.company_metadata import refresh_metadata, filter_by_market_cap
+from utils.executor import run_upstream
+from utils.responses import FastJSONResponse, with_etag
 
 
 router = APIRouter()
 load_dotenv()
-	
-@router.get("/earnings")
-async def get_all_earnings(db = Depends(get_db)):
+
+# Calendar entries processed at once, and how many may start per second, during ingestion
+INGEST_WORKERS = int(os.getenv("EARNINGS_INGEST_WORKERS", 8))
+INGEST_RATE = float(os.getenv("EARNINGS_INGEST_RATE", 5))
+MIN_MARKET_CAP = 10_000_000_000
+
+# Stored rows older than this are recomputed even if their earnings date hasn't moved
+STALE_AFTER = timedelta(hours=float(os.getenv("EARNINGS_STALE_HOURS", 48)))
+
+
+def _query(db, command, values=None):
 	cursor = db.cursor(cursor_factory=RealDictCursor)
+	try:
+		cursor.execute(command, values)
+		return cursor.fetchall()
+	finally:
+		cursor.close()
+
+def _execute(db, command, values=None):
+	cursor = db.cursor()
+	try:
+		cursor.execute(command, values)
+		db.commit()
+	finally:
+		cursor.close()
+	
+EARNINGS_COLUMNS = ("ticker", "earnings_date", "earnings_timing", "expected_move", "avg_volume", "iv30_rv30", "ts_slope", "eps_estimate", "rating")
+
+# Columns GET /earnings can sort by, ticker breaks ties so keyset pages never overlap.
+# Each is NOT NULL and has a (column, ticker) index, see migrations 0002 and 0004.
+SORT_COLUMNS = ("earnings_date", "ticker", "rating")
+MAX_PAGE_SIZE = 500
+
+
+def _encode_cursor(sort, row):
+	return base64.urlsafe_b64encode(orjson.dumps([sort, row[sort], row["ticker"]])).decode()
+
+def _decode_cursor(cursor, sort):
+	try:
+		cursor_sort, value, ticker = orjson.loads(base64.urlsafe_b64decode(cursor.encode()))
+	except Exception:
+		raise HTTPException(status_code=400, detail="Invalid cursor.")
+	if value is None or ticker is None:
+		raise HTTPException(status_code=400, detail="Invalid cursor.")
+	if cursor_sort != sort:
+		raise HTTPException(status_code=400, detail="Cursor was issued for a different sort.")
+	return value, ticker
+
+def _earnings_query(fields, date_from, date_to, timing, min_rating, sort, order, limit, after):
+	"""Builds the SELECT for GET /earnings, every filter and the page boundary end up in SQL."""
+	conditions = []
+	values = []
+	if date_from is not None:
+		conditions.append("earnings_date >= %s")
+		values.append(date_from)
+	if date_to is not None:
+		conditions.append("earnings_date <= %s")
+		values.append(date_to)
+	if timing is not None:
+		conditions.append("earnings_timing = %s")
+		values.append(timing)
+	if min_rating is not None:
+		conditions.append("rating >= %s")
+		values.append(min_rating)
+	if after is not None:
+		# Row comparison matches the (sort, ticker) index order, so the page starts with an index seek
+		conditions.append(f"({sort}, ticker) {'>' if order == 'asc' else '<'} (%s, %s)")
+		values.extend(after)
+
+	command = f"SELECT {', '.join(fields)} FROM earnings"
+	if conditions:
+		command += " WHERE " + " AND ".join(conditions)
+	command += f" ORDER BY {sort} {order.upper()}, ticker {order.upper()}"
+	if limit is not None:
+		command += " LIMIT %s"
+		values.append(limit)
+	return command, values
 
-	cursor.execute("SELECT * FROM earnings")
-	earnings_list = cursor.fetchall()
-	cursor.close()
-	return earnings_list
+@router.get("/earnings")
+async def get_all_earnings(
+	request: Request,
+	date_from: Annotated[date | None, Query(alias="from")] = None,
+	date_to: Annotated[date | None, Query(alias="to")] = None,
+	timing: Annotated[str | None, Query(pattern="^(bmo|amc|dmh)$")] = None,
+	min_rating: int | None = None,
+	sort: Annotated[str, Query(pattern=f"^({'|'.join(SORT_COLUMNS)})$")] = "earnings_date",
+	order: Annotated[str, Query(pattern="^(asc|desc)$")] = "asc",
+	limit: Annotated[int | None, Query(ge=1, le=MAX_PAGE_SIZE)] = None,
+	cursor: str | None = None,
+	fields: Annotated[str | None, Query(description="Comma separated list of columns to return")] = None,
+	db = Depends(get_db),
+):
+	"""
+	Earnings rows, filtered, sorted and paged in SQL. Without a limit every matching row is returned.
+	When more rows follow the page, the X-Next-Cursor header holds the cursor for the next one.
+	"""
+	requested = list(dict.fromkeys(f.strip() for f in fields.split(",") if f.strip())) if fields else list(EARNINGS_COLUMNS)
+	unknown = [field for field in requested if field not in EARNINGS_COLUMNS]
+	if unknown:
+		raise HTTPException(status_code=400, detail=f"Unknown earnings fields: {', '.join(unknown)}")
+
+	# The cursor is built from the sort column and ticker, so those are read even when not requested
+	selected = list(dict.fromkeys(requested + [sort, "ticker"])) if limit is not None else requested
+	after = _decode_cursor(cursor, sort) if cursor else None
+
+	# One row past the page tells whether there is a next page at all
+	command, values = _earnings_query(selected, date_from, date_to, timing, min_rating, sort, order, None if limit is None else limit + 1, after)
+	rows = await run_upstream("database", _query, db, command, values)
+
+	headers = {}
+	if limit is not None and len(rows) > limit:
+		rows = rows[:limit]
+		headers["X-Next-Cursor"] = _encode_cursor(sort, rows[-1])
+	if len(selected) != len(requested):
+		rows = [{field: row[field] for field in requested} for row in rows]
+
+	return with_etag(request, FastJSONResponse(rows, headers=headers))
+
+def _earnings_row(earning, prediction):
+	"""
+	Builds the row to upsert for one calendar entry from its prediction, in
+	EARNINGS_COLUMNS order, or returns None when the ticker is skipped.
+	"""
+	try:
+		if prediction['message'].startswith('Error'):
+			print(f"Error processing {earning['ticker']}: {prediction['message']}")
+			return None
+		if math.isnan(prediction['ts_slope_0_45']):
+			return None
+		try:
+			val = prediction['expected_move']
+			expected_move = float(str(val)[:-1]) if val is not None else 0.0
+		except (ValueError, TypeError, AttributeError):
+			expected_move = 0.0
+		eps_estimate = earning['epsEstimate']
+		return (
+			earning['ticker'],
+			earning['date'],
+			earning['hour'],
+			expected_move,
+			float(round(prediction['avg_volume'], ndigits=2)),
+			float(round(prediction['iv30_rv30'], ndigits=10)),
+			float(round(prediction['ts_slope_0_45'], ndigits=10)),
+			float(round(eps_estimate, ndigits=2)) if eps_estimate is not None else None,
+			int(prediction['rating']),
+		)
+	except Exception as e:
+		print(f"Error processing ticker {earning['ticker']}: {e}")
+		print("Skipping ticker due to error")
+		return None
+
+def _upsert_earnings_rows(db, rows):
+	"""Writes every row with one multi-row INSERT ... ON CONFLICT (ticker) in a single transaction."""
+	# ON CONFLICT can't touch the same row twice in one statement, so keep the last entry per ticker
+	rows = list({row[0]: row for row in rows}.values())
+	if not rows:
+		return 0
+
+	updates = ", ".join(f"{column} = EXCLUDED.{column}" for column in EARNINGS_COLUMNS[1:]) + ", updated_at = now()"
+	command = f"INSERT INTO earnings ({', '.join(EARNINGS_COLUMNS)}) VALUES %s ON CONFLICT (ticker) DO UPDATE SET {updates}"
+
+	cursor = db.cursor()
+	try:
+		execute_values(cursor, command, rows, page_size=len(rows))
+		db.commit()
+	except Exception:
+		db.rollback()
+		raise
+	finally:
+		cursor.close()
+	return len(rows)
+
+def _stored_schedule(db, tickers):
+	"""(earnings_date, earnings_timing, updated_at) of the stored rows for tickers, keyed by ticker."""
+	cursor = db.cursor()
+	try:
+		cursor.execute("SELECT ticker, earnings_date, earnings_timing, updated_at FROM earnings WHERE ticker = ANY(%s)", (list(tickers),))
+		return {ticker: rest for ticker, *rest in cursor.fetchall()}
+	finally:
+		cursor.close()
+
+def _needs_refresh(earning, stored, cutoff):
+	"""True for new tickers, rescheduled earnings and rows computed before cutoff."""
+	if stored is None:
+		return True
+	earnings_date, earnings_timing, updated_at = stored
+	return str(earnings_date) != earning['date'] or earnings_timing != earning['hour'] or updated_at < cutoff
 
 @router.post("/earnings", status_code=201)
 async def post_next_week_earnings(db = Depends(get_db)):
 	print("Adding to earnings table")
 
-	cursor = db.cursor(cursor_factory=RealDictCursor)
+	next_week_earnings = [earning for earning in await run_upstream("finnhub", get_earnings_calendar) if earning['hour'] != '']
 
-	next_week_earnings = get_earnings_calendar()
+	# only companies over 10 billion market cap
+	metadata = await refresh_metadata(db, [earning['ticker'] for earning in next_week_earnings], INGEST_WORKERS, INGEST_RATE, MIN_MARKET_CAP)
+	next_week_earnings = filter_by_market_cap(next_week_earnings, metadata, MIN_MARKET_CAP)
 
-	values = []
-	rowCount = 0
-	for earning in next_week_earnings:
+	# Only new, rescheduled or stale entries are worth another round of option chain fetches
+	stored = await run_upstream("database", _stored_schedule, db, [earning['ticker'] for earning in next_week_earnings])
+	cutoff = datetime.now(timezone.utc) - STALE_AFTER
+	changed = [earning for earning in next_week_earnings if _needs_refresh(earning, stored.get(earning['ticker']), cutoff)]
+	print(f"Recomputing {len(changed)} of {len(next_week_earnings)} earnings entries")
 
-		if earning['hour'] == '':
-			continue
-		
-		try:
-			# only companies over 50 billion market cap
-			if yf.Ticker(earning['ticker']).fast_info['marketCap'] < 10_000_000_000:
-				continue
-		except Exception as e:
-			print("Failed to find market cap data for " + earning['ticker'])
-			print("SKIPPING")
-			continue
-		
-		result = cursor.execute("SELECT * FROM earnings WHERE ticker = '{0}'".format(earning['ticker']))
-		rows = cursor.fetchall()
-		# Row doesnt exist, create it
-
-		if (len(rows) == 1):
-			try:
-				prediction = compute_recommendation(earning['ticker'])
-				if prediction['message'].startswith('Error'):
-					print(f"Error processing {earning['ticker']}: {prediction['message']}")
-					continue
-				try:
-					val = prediction['expected_move']
-					expected_move = float(str(val)[:-1]) if val is not None else 0.0
-				except (ValueError, TypeError, AttributeError):
-					expected_move = 0.0
-				values = (
-					expected_move,
-					float(round(prediction['avg_volume'], ndigits=2)),
-					float(round(prediction['iv30_rv30'], ndigits=10)),
-					float(round(prediction['ts_slope_0_45'], ndigits=10)),
-					prediction['rating'],
-					earning['ticker']
-				)
-				command = "UPDATE earnings SET expected_move = %s, avg_volume = %s, iv30_rv30 = %s, ts_slope = %s, rating = %s WHERE ticker = %s"
-				cursor.execute(command, values)
-				db.commit()
-				rowCount += 1
-			except Exception as e:
-				print(f"Error processing ticker {earning['ticker']}: {e}")
-				print("Skipping ticker due to error")
-		elif len(rows) == 0:
-			prediction = compute_recommendation(earning['ticker'])
-			if prediction['message'].startswith('Error'):
-				print("no earnings for {0}".format(earning['ticker']))
-				continue
-			try:
-				values = (earning['ticker'],
-					earning['date'],
-					earning['hour'],
-					prediction['expected_move'][:-1],
-					float(round(prediction['avg_volume'], ndigits=2)),
-					float(round(prediction['iv30_rv30'], ndigits=10)),
-					float(round(prediction['ts_slope_0_45'], ndigits=10)),
-					float(round(earning['epsEstimate'], ndigits=2)),
-					prediction['rating'])
-				if math.isnan(prediction['ts_slope_0_45']):
-					continue
-				command = "INSERT INTO earnings (ticker, earnings_date, earnings_timing, expected_move, avg_volume, iv30_rv30, ts_slope, eps_estimate, rating) VALUES (%s,%s,%s,%s,%s,%s,%s,%s, %s)"
-				cursor.execute(command, values)
-				db.commit()
-				rowCount +=1
-			except Exception as e:
-				print("Error processing ticker {0}".format(earning['ticker']))
-				print(e)
+	predictions = await compute_recommendations([earning['ticker'] for earning in changed], INGEST_WORKERS, INGEST_RATE)
+	rows = [_earnings_row(earning, predictions.loc[earning['ticker'].strip().upper()]) for earning in changed]
 
-	
-		
-	db.close()
-	return {"message": f'Added {rowCount} rows'}
+	rowCount = await run_upstream("database", _upsert_earnings_rows, db, [row for row in rows if row is not None])
+
+	return {"message": f'Added {rowCount} rows', "unchanged": len(next_week_earnings) - len(changed)}
 
 @router.delete("/earnings")
 async def delete_week_old_earnings(db = Depends(get_db)):
@@ -110,22 +234,14 @@ async def delete_week_old_earnings(db = Depends(get_db)):
 	if db.closed != 0:
 		raise HTTPException(status_code=500, detail="Could not connect to database")
 
-	cursor = db.cursor(cursor_factory=RealDictCursor)
-
-	cursor.execute("DELETE FROM earnings WHERE earnings_date < CURRENT_DATE;")
-	db.commit()
+	await run_upstream("database", _execute, db, "DELETE FROM earnings WHERE earnings_date < CURRENT_DATE;")
 
-	cursor.close()
 	return {"message": "Successfully deleted old rows"}
 
 @router.delete("/earnings/current")
 async def delete_today_before_hour_earnings(db = Depends(get_db)):
 	print("Deleting earnings before market today")
 
-	cursor = db.cursor(cursor_factory=RealDictCursor)
-
-	cursor.execute("DELETE FROM earnings WHERE earnings_date = CURRENT_DATE AND earnings_timing = 'bmo';")
-	db.commit()
+	await run_upstream("database", _execute, db, "DELETE FROM earnings WHERE earnings_date = CURRENT_DATE AND earnings_timing = 'bmo';")
 
-	cursor.close()
 	return {"message": "Successfully deleted rows today's rows before market open"}
@@ -0,0 +1,15 @@
+from fastapi import APIRouter
+from utils import market_data, database, quotes
+from utils.executor import upstream_stats
+
+router = APIRouter()
+
+@router.get("/stats")
+async def get_server_stats():
+	"""Counters for the shared market-data cache, database pool, upstream executor and quote streams."""
+	return {
+		"marketData": market_data.cache_stats(),
+		"databasePool": database.pool_stats(),
+		"upstreams": upstream_stats(),
+		"quoteStreams": quotes.hub.stats(),
+	}
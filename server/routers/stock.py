@@ -1,23 +1,47 @@
-from fastapi import APIRouter, HTTPException, Path, Request
-from fastapi.responses import JSONResponse
-import yfinance as yf
-import datetime
-from datetime import timedelta
+import asyncio
+import orjson
+from fastapi import APIRouter, HTTPException, Path, Query, Request
+from fastapi.responses import StreamingResponse
+from utils.responses import FastJSONResponse, ArrowResponse, arrow_table, wants_arrow, with_etag
+from datetime import datetime, timedelta
 from typing import Annotated
-from routers.earnings import compute_recommendation
+from pydantic import BaseModel, Field
+from utils.prediction_cache import cached_recommendation
+from utils import market_data, quotes
+from utils.quotes import price_update, quote_update
+from utils.executor import run_upstream
+from utils.downsample import lttb_indices
 
 router = APIRouter()
 
+# Tickers one stream may watch, and seconds between keepalive comments on a quiet stream
+MAX_STREAM_TICKERS = 50
+STREAM_KEEPALIVE = 15
+
+# Tickers one /stock/quotes request may ask for
+MAX_QUOTE_TICKERS = 100
+
+# Tickers one batch prediction request may ask for, and how many of them it may compute at once
+MAX_PREDICTION_TICKERS = 100
+MAX_PREDICTION_CONCURRENCY = 16
+
+
+def parse_tickers(tickers, limit):
+	"""Unique upper-cased symbols from a comma separated list, 400 if there are none or too many."""
+	symbols = list(dict.fromkeys(t.strip().upper() for t in tickers.split(",") if t.strip()))
+	if not symbols or len(symbols) > limit:
+		raise HTTPException(status_code=400, detail=f"Provide between 1 and {limit} tickers.")
+	return symbols
+
 
 @router.get("/stock/{ticker}/details")
 async def get_stock_details(ticker: str):
 	try:
-		yf_ticker = yf.Ticker(ticker)
-		info = yf_ticker.info
+		info = await run_upstream("yahoo", market_data.get_info, ticker)
 		if info.get('regularMarketPrice') is None:
 			raise HTTPException(status_code=404, detail=f"Details for {ticker} not found.")
 
-		return JSONResponse({
+		return FastJSONResponse({
 			"name": info.get('longName') if 'longName' in info else info.get('shortName'),
 			"price": info.get('regularMarketPrice'),
 			"change": info.get('regularMarketChange'),
@@ -74,27 +98,63 @@ def get_yfinance_params(range_str: str) -> dict:
 
 	return params
 
+def serialize_chart(history, columnar=False, ohlcv=False):
+	"""
+	Builds the chart payload straight from the DataFrame's arrays.
+	Rows look like {"time", "price"}; columnar returns {"time": [...], "price": [...]}.
+	With ohlcv, open/high/low/volume are included alongside price (the close).
+	"""
+	columns = {
+		"time": [ts.isoformat() for ts in history.index.to_pydatetime()],
+		"price": history['Close'].to_numpy().tolist(),
+	}
+	if ohlcv:
+		columns["open"] = history['Open'].to_numpy().tolist()
+		columns["high"] = history['High'].to_numpy().tolist()
+		columns["low"] = history['Low'].to_numpy().tolist()
+		columns["volume"] = history['Volume'].to_numpy().tolist()
+
+	if columnar:
+		return columns
+
+	keys = list(columns)
+	return [dict(zip(keys, values)) for values in zip(*columns.values())]
+
+def chart_table(history, ohlcv=False):
+	"""The chart columns as an Arrow table, with time kept as a timestamp column."""
+	columns = {"Close": "price", "Open": "open", "High": "high", "Low": "low", "Volume": "volume"} if ohlcv else {"Close": "price"}
+	chart_df = history[list(columns)].rename(columns=columns).rename_axis("time").reset_index()
+	return arrow_table(chart_df)
+
 @router.get("/stock/{ticker}/chart")
-async def get_stock_chart(ticker: str, request: Request):
+async def get_stock_chart(
+	ticker: str,
+	request: Request,
+	format: Annotated[str, Query(pattern="^(rows|columnar)$")] = "rows",
+	ohlcv: bool = False,
+	max_points: Annotated[int | None, Query(ge=3)] = None,
+):
 	range_str = request.query_params.get('range', '1D')
 
 	try:
 		params = get_yfinance_params(range_str)
 
-		stock = yf.Ticker(ticker)
-		history = stock.history(**params)
+		history = await run_upstream("yahoo", market_data.get_history, ticker, **params)
 
 		if history.empty:
 			raise HTTPException(status_code=404, detail=f"No data found for {ticker} in the specified range.")
 		
 		history = history.dropna(subset=['Close'])
 
-		chart_data = [
-			{"time": index.isoformat(), "price": row['Close']}
-			for index, row in history.iterrows()
-		]
+		if max_points is not None and len(history) > max_points:
+			# Downsample on the close so the line keeps its shape at chart resolution
+			times = history.index.asi8.astype(float)
+			history = history.iloc[lttb_indices(times, history['Close'].to_numpy(), max_points)]
+
+		if wants_arrow(request):
+			return with_etag(request, ArrowResponse(chart_table(history, ohlcv=ohlcv)))
 
-		return {"chartData": chart_data}
+		return with_etag(request, FastJSONResponse({"chartData": serialize_chart(history, columnar=format == "columnar", ohlcv=ohlcv)}))
 	except Exception as e:
 		print(f"An error occurred: {e}")
 		raise HTTPException(
@@ -103,44 +163,56 @@ async def get_stock_chart(ticker: str, request: Request):
 		)
 
 	
+@router.get("/stock/stream")
+async def stream_quotes(
+	request: Request,
+	tickers: Annotated[str, Query(description="Comma separated list of tickers to watch")],
+):
+	"""
+	Server-sent events with live quotes. Each 'quote' event carries one ticker's
+	currentPrice fields, sent whenever they change. Comments keep idle connections open.
+	"""
+	symbols = parse_tickers(tickers, MAX_STREAM_TICKERS)
+
+	async def events():
+		queue = quotes.hub.subscribe(symbols)
+		try:
+			while not await request.is_disconnected():
+				try:
+					update = await asyncio.wait_for(queue.get(), timeout=STREAM_KEEPALIVE)
+				except asyncio.TimeoutError:
+					yield ": keepalive\n\n"
+					continue
+				yield f"event: quote\ndata: {orjson.dumps(update).decode()}\n\n"
+		finally:
+			quotes.hub.unsubscribe(queue, symbols)
+
+	return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+@router.get("/stock/quotes")
+async def get_quotes(tickers: Annotated[str, Query(description="Comma separated list of tickers")]):
+	"""currentPrice fields for many tickers, fetched from Yahoo in one batched request."""
+	symbols = parse_tickers(tickers, MAX_QUOTE_TICKERS)
+	try:
+		fetched = await run_upstream("yahoo", market_data.get_quotes, symbols)
+	except Exception as e:
+		print(f"Failed to fetch quotes: {e}")
+		raise HTTPException(status_code=502, detail="Could not retrieve quotes.")
+
+	updates = {symbol: quote_update(symbol, fetched.get(symbol)) for symbol in symbols}
+	return FastJSONResponse({
+		"quotes": [update for update in updates.values() if update is not None],
+		"notFound": [symbol for symbol, update in updates.items() if update is None],
+	})
+
+
 @router.get("/stock/{stock}/currentPrice")
 async def get_current_price(stock: Annotated[str, Path(title="The ticker to fetch")]):
 	try:
-		ticker = yf.Ticker(stock)
-		info = ticker.info
-
-		prev_close = info.get("regularMarketPrice")
-		prev_close_percent = round(info.get("regularMarketChangePercent"), ndigits=2)
-
-		if 'postMarketPrice' in info:
-			post_price = info.get("postMarketPrice")
-			post_price_percent = round(info.get("postMarketChangePercent"), ndigits=2)
-			
-			return {
-				"post_price": post_price,
-				"post_price_percent": post_price_percent,
-				"last_price": prev_close,
-				"last_price_percent": prev_close_percent,
-				"source": "after-hours"
-			}
-
-		elif "preMarketPrice" in info:
-
-			pre_price = info.get("preMarketPrice")
-			pre_price_percent = round(info.get("preMarketChangePercent"), ndigits=2)
-			return {
-				"pre_price": pre_price,
-				"pre_price_percent": pre_price_percent,
-				"last_price": prev_close,
-				"last_price_percent": prev_close_percent,
-				"source": "before-hours"
-			}
-		else:
-			return {
-				"last_price": prev_close,
-				"last_price_percent": prev_close_percent,
-				"source": "during-hours"
-			}
+		symbol = stock.strip().upper()
+		quote = (await run_upstream("yahoo", market_data.get_quotes, [symbol]))[symbol]
+		return FastJSONResponse(price_update(quote))
 
 	except Exception as e:
 		print(e)
@@ -149,4 +221,42 @@ async def get_current_price(stock: Annotated[str, Path(title="The ticker to fetc
 
 @router.get("/stock/{stock}/earnings/prediction/")
 async def get_earnings_prediction(stock: Annotated[str, Path(title="The ticker to fetch prediction about")]):
-	return compute_recommendation(stock)
+	return FastJSONResponse(await cached_recommendation(stock))
+
+
+class PredictionBatch(BaseModel):
+	tickers: list[str] = Field(min_length=1, max_length=MAX_PREDICTION_TICKERS)
+	concurrency: int = Field(default=8, ge=1, le=MAX_PREDICTION_CONCURRENCY)
+
+
+@router.post("/stock/earnings/predictions")
+async def post_earnings_predictions(batch: PredictionBatch):
+	"""
+	Earnings predictions for many tickers, streamed back as NDJSON. Each line is one
+	ticker's prediction plus a 'ticker' field, written as soon as it finishes, so slow
+	names don't hold up the rest. At most batch.concurrency are computed at once.
+	"""
+	symbols = list(dict.fromkeys(t.strip().upper() for t in batch.tickers if t.strip()))
+	if not symbols:
+		raise HTTPException(status_code=400, detail="Provide at least one ticker.")
+
+	semaphore = asyncio.Semaphore(batch.concurrency)
+
+	async def predict(ticker):
+		async with semaphore:
+			try:
+				return {"ticker": ticker, **await cached_recommendation(ticker)}
+			except Exception as e:
+				return {"ticker": ticker, "message": f"Error: {e}"}
+
+	async def lines():
+		tasks = [asyncio.ensure_future(predict(ticker)) for ticker in symbols]
+		try:
+			for finished in asyncio.as_completed(tasks):
+				yield orjson.dumps(await finished, option=orjson.OPT_SERIALIZE_NUMPY) + b"\n"
+		finally:
+			# The client went away, don't keep computing for nobody
+			for task in tasks:
+				task.cancel()
+
+	return StreamingResponse(lines(), media_type="application/x-ndjson")
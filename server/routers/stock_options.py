@@ -1,19 +1,22 @@
-from fastapi import APIRouter, HTTPException
-import yfinance as yf
+from fastapi import APIRouter, HTTPException, Query, Request
+from typing import Annotated
 import numpy as np
+import pyarrow as pa
+from utils import market_data
+from utils.executor import run_upstream
+from utils.responses import FastJSONResponse, ArrowResponse, arrow_table, with_metadata, wants_arrow, with_etag
 
 router = APIRouter()
 
 @router.get("/option/{ticker}/allExpirationDates")
 async def get_all_expiration_dates(ticker: str):
 	try:
-		stock = yf.Ticker(ticker)
-		exp_dates = stock.options
+		exp_dates = await run_upstream("yahoo", market_data.get_options, ticker)
 
 		if not exp_dates:
 			raise HTTPException(status_code=404, detail=f"No options data found for {ticker}.")
 
-		return exp_dates
+		return FastJSONResponse(exp_dates)
 	except Exception as e:
 		print(f"An error occurred: {e}")
 		raise HTTPException(
@@ -21,42 +24,99 @@ async def get_all_expiration_dates(ticker: str):
 			detail="Failed to fetch options expiration dates."
 		)
 
+def strike_window(chain_df, spot, strike_min=None, strike_max=None, strike_pct=None, max_moneyness=None, columns=None):
+	"""
+	Keeps the contracts inside the strike window and only the requested columns.
+	strike_pct keeps strikes within ±N% of spot and max_moneyness caps |ln(strike / spot)|.
+	The masks are computed on the strike array, missing values are left as they are.
+	"""
+	strikes = chain_df['strike'].to_numpy(dtype=float)
+	mask = np.ones(len(strikes), dtype=bool)
+	if strike_min is not None:
+		mask &= strikes >= strike_min
+	if strike_max is not None:
+		mask &= strikes <= strike_max
+	if strike_pct is not None:
+		mask &= np.abs(strikes - spot) <= spot * strike_pct / 100.0
+	if max_moneyness is not None:
+		with np.errstate(divide='ignore', invalid='ignore'):
+			mask &= np.abs(np.log(strikes / spot)) <= max_moneyness
+
+	return chain_df.loc[mask, columns] if columns else chain_df[mask]
+
+def zero_missing(chain_df):
+	"""The JSON payload has always shown missing quotes and IVs as 0."""
+	return chain_df.replace([np.inf, -np.inf], np.nan).fillna(0)
+
+def options_table(puts, calls, date, current_price):
+	"""
+	Puts and calls as one Arrow table with a 'side' column, so both sides share a schema.
+	The expiration date and current price travel in the schema metadata.
+	"""
+	tables = []
+	for side, chain_df in (("put", puts), ("call", calls)):
+		table = arrow_table(chain_df)
+		tables.append(table.append_column("side", pa.array([side] * table.num_rows, type=pa.string())))
+	return with_metadata(pa.concat_tables(tables, promote_options="permissive"), {"date": date, "currentPrice": current_price})
+
 @router.get("/option/{ticker}")
-async def get_stock_options(ticker: str, expiration: str = None):
+async def get_stock_options(
+	ticker: str,
+	request: Request,
+	expiration: str = None,
+	strike_min: Annotated[float | None, Query(ge=0)] = None,
+	strike_max: Annotated[float | None, Query(ge=0)] = None,
+	strike_pct: Annotated[float | None, Query(gt=0)] = None,
+	max_moneyness: Annotated[float | None, Query(gt=0)] = None,
+	columns: Annotated[str | None, Query(description="Comma separated list of chain columns to return")] = None,
+):
+	selected_columns = [column.strip() for column in columns.split(",") if column.strip()] if columns else None
+
 	try:
-		stock = yf.Ticker(ticker)
-		exp_dates = list(stock.options)
+		exp_dates = list(await run_upstream("yahoo", market_data.get_options, ticker))
 
 		if not exp_dates:
 			raise HTTPException(status_code=404, detail=f"No options data found for {ticker}.")
 
-		if expiration == None:
-			chain = stock.option_chain(exp_dates[0])
-			puts_df = chain.puts.replace([np.inf, -np.inf], np.nan).fillna(0)
-			calls_df = chain.calls.replace([np.inf, -np.inf], np.nan).fillna(0)
-			return {
-				"date": exp_dates[0],
-				"puts": puts_df.to_dict(orient="records"),
-				"calls": calls_df.to_dict(orient="records"),
-				"currentPrice": stock.history(period='1d')['Close'].iloc[0]
-			}
-		else:
-			try:
-				chain = stock.option_chain(expiration)
-				puts_df = chain.puts.replace([np.inf, -np.inf], np.nan).fillna(0)
-				calls_df = chain.calls.replace([np.inf, -np.inf], np.nan).fillna(0)
-				return {
-					"date": expiration,
-					"puts": puts_df.to_dict(orient="records"),
-					"calls": calls_df.to_dict(orient="records"),
-					"currentPrice": stock.history(period='1d')['Close'].iloc[0]
-				}
-			except ValueError:
-				raise HTTPException(status_code=404, detail=f"Invalid expiration date {expiration} for {ticker}.")
-		return {"options": exp_dates}
+		date = exp_dates[0] if expiration == None else expiration
+		try:
+			chain = await run_upstream("yahoo", market_data.get_option_chain, ticker, date)
+		except ValueError:
+			raise HTTPException(status_code=404, detail=f"Invalid expiration date {expiration} for {ticker}.")
+
+		if selected_columns:
+			unknown = [column for column in selected_columns if column not in chain.calls.columns]
+			if unknown:
+				raise HTTPException(status_code=400, detail=f"Unknown option columns: {', '.join(unknown)}")
+
+		history = await run_upstream("yahoo", market_data.get_history, ticker, period='1d')
+		current_price = history['Close'].iloc[0]
+		window = {
+			"strike_min": strike_min,
+			"strike_max": strike_max,
+			"strike_pct": strike_pct,
+			"max_moneyness": max_moneyness,
+			"columns": selected_columns,
+		}
+
+		puts = strike_window(chain.puts, current_price, **window)
+		calls = strike_window(chain.calls, current_price, **window)
+
+		if wants_arrow(request):
+			# Arrow keeps missing values as real nulls instead of zeros
+			return with_etag(request, ArrowResponse(options_table(puts, calls, date, current_price)))
+
+		return with_etag(request, FastJSONResponse({
+			"date": date,
+			"puts": zero_missing(puts),
+			"calls": zero_missing(calls),
+			"currentPrice": current_price
+		}))
+	except HTTPException:
+		raise
 	except Exception as e:
 		print(f"An error occurred: {e}")
 		raise HTTPException(
 			status_code=500,
 			detail="Failed to fetch options data."
-		)
\ No newline at end of file
+		)
@@ -0,0 +1,117 @@
+import os
+import asyncio
+from datetime import datetime, timedelta, timezone
+import pandas as pd
+from psycopg2.extras import execute_values
+from utils import market_data
+from utils.executor import run_upstream, RateLimiter
+
+# Company rows older than this get refetched from Yahoo, anything newer is trusted as is
+MAX_AGE = timedelta(hours=float(os.getenv("COMPANY_METADATA_MAX_AGE_HOURS", 24)))
+
+COLUMNS = ["ticker", "market_cap", "name", "sector", "updated_at"]
+
+
+def load_metadata(db, tickers):
+	"""Stored metadata for the given tickers as a DataFrame indexed by ticker."""
+	cursor = db.cursor()
+	try:
+		cursor.execute("SELECT ticker, market_cap, name, sector, updated_at FROM company_metadata WHERE ticker = ANY(%s)", (list(tickers),))
+		rows = cursor.fetchall()
+	finally:
+		cursor.close()
+	return pd.DataFrame.from_records(rows, columns=COLUMNS).set_index("ticker")
+
+
+def save_metadata(db, rows):
+	"""Upserts (ticker, market_cap, name, sector) rows in one statement."""
+	if not rows:
+		return
+	cursor = db.cursor()
+	try:
+		execute_values(
+			cursor,
+			"INSERT INTO company_metadata (ticker, market_cap, name, sector) VALUES %s "
+			"ON CONFLICT (ticker) DO UPDATE SET market_cap = EXCLUDED.market_cap, name = EXCLUDED.name, "
+			"sector = EXCLUDED.sector, updated_at = now()",
+			rows,
+			page_size=len(rows),
+		)
+		db.commit()
+	except Exception:
+		db.rollback()
+		raise
+	finally:
+		cursor.close()
+
+
+def _fetch_sector(ticker):
+	return market_data.get_info(ticker).get('sector')
+
+
+async def refresh_metadata(db, tickers, workers=8, rate=0, min_market_cap=0):
+	"""
+	Returns metadata for every ticker, refetching only the ones that are
+	missing or older than MAX_AGE and writing those back in bulk.
+	Market cap and name come from batched quote requests (100 symbols each).
+	The sector isn't in those quotes, so it is looked up with one .info call
+	per ticker, and only for tickers worth at least min_market_cap that don't
+	have one stored yet. Tickers Yahoo has no quote for are stored with a NULL
+	market cap, so they too are only asked about again after MAX_AGE.
+	"""
+	tickers = list(dict.fromkeys(tickers))
+	metadata = await run_upstream("database", load_metadata, db, tickers)
+
+	cutoff = datetime.now(timezone.utc) - MAX_AGE
+	fresh = metadata.index[pd.to_datetime(metadata["updated_at"], utc=True) >= cutoff]
+	stale = [ticker for ticker in tickers if ticker not in fresh]
+	if not stale:
+		return metadata
+
+	try:
+		quotes = await run_upstream("yahoo", market_data.get_quotes, stale)
+	except Exception as e:
+		# Nothing learned about any ticker, leave them stale for the next run
+		print(f"Failed to fetch quotes for company metadata: {e}")
+		return metadata
+
+	semaphore = asyncio.Semaphore(workers)
+	limiter = RateLimiter(rate)
+
+	async def fetch_sector(ticker):
+		async with semaphore:
+			await limiter.wait()
+			try:
+				return await run_upstream("yahoo", _fetch_sector, ticker)
+			except Exception as e:
+				print(f"Failed to fetch sector for {ticker}: {e}")
+				return None
+
+	def stored_sector(ticker):
+		return metadata.at[ticker, "sector"] if ticker in metadata.index and pd.notna(metadata.at[ticker, "sector"]) else None
+
+	rows = []
+	for ticker in stale:
+		quote = quotes.get(ticker.strip().upper()) or {}
+		rows.append((ticker, quote.get('marketCap'), quote.get('longName') or quote.get('shortName'), stored_sector(ticker)))
+
+	# Only companies that make the cut are worth a quoteSummary request for their sector
+	missing_sector = [i for i, row in enumerate(rows) if row[3] is None and row[1] is not None and row[1] >= min_market_cap]
+	sectors = await asyncio.gather(*(fetch_sector(rows[i][0]) for i in missing_sector))
+	for i, sector in zip(missing_sector, sectors):
+		rows[i] = rows[i][:3] + (sector,)
+
+	await run_upstream("database", save_metadata, db, rows)
+
+	fetched = pd.DataFrame.from_records(rows, columns=COLUMNS[:-1]).set_index("ticker")
+	fetched["updated_at"] = datetime.now(timezone.utc)
+	return pd.concat([metadata.drop(index=fetched.index, errors="ignore"), fetched])
+
+
+def filter_by_market_cap(calendar, metadata, min_market_cap):
+	"""Keeps the calendar entries whose company is worth at least min_market_cap."""
+	if not calendar:
+		return []
+	tickers = pd.Series([entry['ticker'] for entry in calendar])
+	keep = (tickers.map(metadata["market_cap"]).astype(float) >= min_market_cap).to_numpy()
+	return [entry for entry, kept in zip(calendar, keep) if kept]
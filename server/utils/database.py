@@ -1,16 +1,152 @@
 import os
+import time
+import threading
+from contextlib import contextmanager
 import psycopg2
+from psycopg2 import pool as pg_pool
 from fastapi import HTTPException
 
-def get_db():
-    conn = None
+
+class ConnectionPool:
+    """
+    Process-wide pool of psycopg2 connections.
+    Checkouts wait up to `timeout` seconds for a free connection, and every
+    connection is pinged before it is handed out so dead ones get replaced.
+    """
+
+    def __init__(self, dsn, minconn=1, maxconn=10, timeout=5.0, health_check=True):
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.health_check = health_check
+        self._pool = pg_pool.ThreadedConnectionPool(minconn, maxconn, dsn)
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._lock = threading.Lock()
+        self._in_use = 0
+        self._checkouts = 0
+        self._timeouts = 0
+        self._replaced = 0
+        self._wait_seconds = 0.0
+
+    def getconn(self):
+        started = time.monotonic()
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self._timeouts += 1
+            raise pg_pool.PoolError(f"Timed out after {self.timeout}s waiting for a database connection")
+
+        try:
+            conn = self._checkout()
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self._in_use += 1
+            self._checkouts += 1
+            self._wait_seconds += time.monotonic() - started
+        return conn
+
+    def _checkout(self):
+        conn = self._pool.getconn()
+        if self._is_healthy(conn):
+            return conn
+
+        # Drop the dead connection and open a fresh one in its place
+        self._pool.putconn(conn, close=True)
+        with self._lock:
+            self._replaced += 1
+        return self._pool.getconn()
+
+    def _is_healthy(self, conn):
+        if conn.closed:
+            return False
+        if not self.health_check:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def putconn(self, conn):
+        try:
+            # ThreadedConnectionPool rolls back anything left open before reuse
+            self._pool.putconn(conn, close=bool(conn.closed))
+        finally:
+            with self._lock:
+                self._in_use -= 1
+            self._slots.release()
+
+    def close(self):
+        self._pool.closeall()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "minSize": self.minconn,
+                "maxSize": self.maxconn,
+                "inUse": self._in_use,
+                "checkouts": self._checkouts,
+                "checkoutTimeouts": self._timeouts,
+                "replacedConnections": self._replaced,
+                "avgWaitMs": round(self._wait_seconds / self._checkouts * 1000, 3) if self._checkouts else 0.0,
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def init_pool():
+    """Creates the process-wide pool. Safe to call more than once."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool(
+                os.getenv("INTERNAL_DATABASE_URL"),
+                minconn=int(os.getenv("DB_POOL_MIN", 1)),
+                maxconn=int(os.getenv("DB_POOL_MAX", 10)),
+                timeout=float(os.getenv("DB_POOL_TIMEOUT", 5)),
+                health_check=os.getenv("DB_POOL_HEALTH_CHECK", "1") != "0",
+            )
+    return _pool
+
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+
+def pool_stats():
+    return _pool.stats() if _pool is not None else None
+
+
+@contextmanager
+def pooled_connection():
+    """Borrows a connection from the pool and always hands it back."""
+    pool = init_pool()
+    conn = pool.getconn()
     try:
-        db_url = os.getenv("INTERNAL_DATABASE_URL")
-        conn = psycopg2.connect(db_url)
         yield conn
+    finally:
+        pool.putconn(conn)
+
+
+def get_db():
+    try:
+        pool = init_pool()
+        conn = pool.getconn()
     except Exception as e:
         print(f"Database Connection Error: {e}")
         raise HTTPException(status_code=500, detail="Database connection failed")
+
+    try:
+        yield conn
     finally:
-        if conn:
-            conn.close()
\ No newline at end of file
+        pool.putconn(conn)
@@ -0,0 +1,40 @@
+import numpy as np
+
+
+def lttb_indices(x, y, max_points):
+	"""
+	Largest-Triangle-Three-Buckets downsampling.
+	Returns the sorted indices of at most max_points points that keep the
+	visual shape of the (x, y) line. The first and last points are always kept.
+	Bucket averages and the triangle areas inside each bucket are computed
+	with array operations, only the walk from bucket to bucket is a loop.
+	"""
+	x = np.asarray(x, dtype=float)
+	y = np.asarray(y, dtype=float)
+	n = len(x)
+	if max_points is None or max_points >= n or max_points < 3:
+		return np.arange(n)
+
+	# Interior points 1..n-2 split into max_points - 2 buckets
+	edges = np.linspace(1, n - 1, max_points - 1).astype(int)
+	starts, ends = edges[:-1], edges[1:]
+	counts = ends - starts
+
+	# Average point of every bucket, with the last point standing in after the final bucket
+	avg_x = np.append(np.add.reduceat(x[:n - 1], starts) / counts, x[-1])
+	avg_y = np.append(np.add.reduceat(y[:n - 1], starts) / counts, y[-1])
+
+	selected = np.empty(max_points, dtype=int)
+	selected[0] = 0
+	selected[-1] = n - 1
+	a = 0
+	for i, (start, end) in enumerate(zip(starts, ends)):
+		# Twice the triangle area between the previous pick, each candidate and the next bucket's average
+		areas = np.abs(
+			(x[a] - avg_x[i + 1]) * (y[start:end] - y[a])
+			- (x[a] - x[start:end]) * (avg_y[i + 1] - y[a])
+		)
+		a = start + int(np.argmax(areas))
+		selected[i + 1] = a
+
+	return selected
@@ -1,8 +1,15 @@
+import asyncio
 import numpy as np
+import pandas as pd
 import finnhub
 import os
 from datetime import datetime, timedelta
-import yfinance as yf
+from utils import market_data
+from utils.executor import run_upstream, RateLimiter
+
+# Seconds a single upstream fetch may take before the prediction gives up on it
+FETCH_TIMEOUT = float(os.getenv("PREDICTION_FETCH_TIMEOUT", 10))
+
 def interp1d(x, y, kind='linear', fill_value='extrapolate'):
     """
     A lightweight, NumPy-only replacement for scipy.interpolate.interp1d
@@ -80,41 +87,66 @@ def filter_dates(dates):
 	raise ValueError("No date 45 days or more in the future found.")
 
 
-def yang_zhang(price_data, window=30, trading_periods=252, return_last_only=True):
-	log_ho = (price_data['High'] / price_data['Open']).apply(np.log)
-	log_lo = (price_data['Low'] / price_data['Open']).apply(np.log)
-	log_co = (price_data['Close'] / price_data['Open']).apply(np.log)
-	
-	log_oc = (price_data['Open'] / price_data['Close'].shift(1)).apply(np.log)
-	log_oc_sq = log_oc**2
-	
-	log_cc = (price_data['Close'] / price_data['Close'].shift(1)).apply(np.log)
-	log_cc_sq = log_cc**2
-	
-	rs = log_ho * (log_ho - log_co) + log_lo * (log_lo - log_co)
-	
-	close_vol = log_cc_sq.rolling(
-		window=window,
-		center=False
-	).sum() * (1.0 / (window - 1.0))
+def _rolling_sum(values, window):
+	"""
+	Trailing rolling sum along the last axis using cumulative sums.
+	Like pandas' rolling().sum(), a window that is incomplete or holds a NaN gives NaN.
+	"""
+	nans = np.isnan(values)
+	pad = np.zeros(values.shape[:-1] + (1,))
+	sums = np.concatenate([pad, np.cumsum(np.where(nans, 0.0, values), axis=-1)], axis=-1)
+	nan_counts = np.concatenate([pad, np.cumsum(nans, axis=-1)], axis=-1)
+
+	result = np.full(values.shape, np.nan)
+	window_sums = sums[..., window:] - sums[..., :-window]
+	window_sums[(nan_counts[..., window:] - nan_counts[..., :-window]) > 0] = np.nan
+	result[..., window - 1:] = window_sums
+	return result
+
+def yang_zhang_array(open_, high, low, close, window=30, trading_periods=252, return_last_only=True):
+	"""
+	NumPy Yang-Zhang volatility. Prices are 1-D arrays for one ticker or
+	2-D arrays shaped (tickers, days) to compute a whole universe at once.
+	Returns the latest value per ticker, or the full rolling series
+	(NaN until the first full window) when return_last_only is False.
+	"""
+	open_, high, low, close = (np.asarray(prices, dtype=float) for prices in (open_, high, low, close))
+	prev_close = np.concatenate([np.full(close.shape[:-1] + (1,), np.nan), close[..., :-1]], axis=-1)
+
+	with np.errstate(divide='ignore', invalid='ignore'):
+		log_ho, log_lo, log_co, log_oc, log_cc = np.log(np.stack([
+			high / open_,
+			low / open_,
+			close / open_,
+			open_ / prev_close,
+			close / prev_close,
+		]))
+
+		rs = log_ho * (log_ho - log_co) + log_lo * (log_lo - log_co)
+		close_vol, open_vol, window_rs = _rolling_sum(np.stack([log_cc**2, log_oc**2, rs]), window) * (1.0 / (window - 1.0))
+
+		k = 0.34 / (1.34 + ((window + 1) / (window - 1)) )
+		result = np.sqrt(open_vol + k * close_vol + (1 - k) * window_rs) * np.sqrt(trading_periods)
 
-	open_vol = log_oc_sq.rolling(
-		window=window,
-		center=False
-	).sum() * (1.0 / (window - 1.0))
+	if return_last_only:
+		return result[..., -1]
+	return result
 
-	window_rs = rs.rolling(
+def yang_zhang(price_data, window=30, trading_periods=252, return_last_only=True):
+	result = yang_zhang_array(
+		price_data['Open'].to_numpy(),
+		price_data['High'].to_numpy(),
+		price_data['Low'].to_numpy(),
+		price_data['Close'].to_numpy(),
 		window=window,
-		center=False
-	).sum() * (1.0 / (window - 1.0))
-
-	k = 0.34 / (1.34 + ((window + 1) / (window - 1)) )
-	result = (open_vol + k * close_vol + (1 - k) * window_rs).apply(np.sqrt) * np.sqrt(trading_periods)
+		trading_periods=trading_periods,
+		return_last_only=False,
+	)
 
 	if return_last_only:
-		return result.iloc[-1]
+		return result[-1]
 	else:
-		return result.dropna()
+		return pd.Series(result, index=price_data.index).dropna()
 	
 
 def build_term_structure(days, ivs):
@@ -139,112 +171,225 @@ def build_term_structure(days, ivs):
 	return term_spline
 
 def get_current_price(ticker):
-	todays_data = ticker.history(period='1d')
+	todays_data = market_data.get_history(ticker, period='1d')
 	return todays_data['Close'].iloc[0]
 
-def compute_recommendation(ticker):
-	try:
-		ticker = ticker.strip().upper()
-		if not ticker:
-			return {'message': "Error: No stock symbol provided."}
-		
-		try:
-			stock = yf.Ticker(ticker)
-			if len(stock.options) == 0:
-				raise KeyError()
-		except KeyError:
-			return {'message': f"Error: No options found for stock symbol '{ticker}'."}
-		
-		exp_dates = list(stock.options)
-		try:
-			exp_dates = filter_dates(exp_dates)
-		except:
-			return {'message': "Error: Not enough option data."}
-		
-		options_chains = {}
-		for exp_date in exp_dates:
-			options_chains[exp_date] = stock.option_chain(exp_date)
-		
-		try:
-			underlying_price = get_current_price(stock)
-			if underlying_price is None:
-				raise ValueError("No market price found.")
-		except Exception:
-			return {'message': "Error: Unable to retrieve underlying stock price."}
-		
-		atm_iv = {}
-		straddle = None 
-		i = 0
-		for exp_date, chain in options_chains.items():
-			calls = chain.calls
-			puts = chain.puts
-
-			if calls.empty or puts.empty:
-				continue
-
-			call_diffs = (calls['strike'] - underlying_price).abs()
-			call_idx = call_diffs.idxmin()
-			call_iv = calls.loc[call_idx, 'impliedVolatility']
-
-			put_diffs = (puts['strike'] - underlying_price).abs()
-			put_idx = put_diffs.idxmin()
-			put_iv = puts.loc[put_idx, 'impliedVolatility']
-
-			atm_iv_value = (call_iv + put_iv) / 2.0
-			atm_iv[exp_date] = atm_iv_value
-
-			if i == 0:
-				call_bid = calls.loc[call_idx, 'bid']
-				call_ask = calls.loc[call_idx, 'ask']
-				put_bid = puts.loc[put_idx, 'bid']
-				put_ask = puts.loc[put_idx, 'ask']
-				
-				if call_bid is not None and call_ask is not None:
-					call_mid = (call_bid + call_ask) / 2.0
-				else:
-					call_mid = None
-
-				if put_bid is not None and put_ask is not None:
-					put_mid = (put_bid + put_ask) / 2.0
-				else:
-					put_mid = None
-
-				if call_mid is not None and put_mid is not None:
-					straddle = (call_mid + put_mid)
-
-			i += 1
-		
-		if not atm_iv:
-			return {'message': "Error: Could not determine ATM IV for any expiration dates."}
-		
-		today = datetime.today().date()
-		dtes = []
-		ivs = []
-		for exp_date, iv in atm_iv.items():
-			exp_date_obj = datetime.strptime(exp_date, "%Y-%m-%d").date()
-			days_to_expiry = (exp_date_obj - today).days
-			dtes.append(days_to_expiry)
-			ivs.append(iv)
-		
-		term_spline = build_term_structure(dtes, ivs)
-		
-		ts_slope_0_45 = (term_spline(45) - term_spline(dtes[0])) / (45-dtes[0])
-		
-		price_history = stock.history(period='3mo')
-		iv30_rv30 = term_spline(30) / yang_zhang(price_history)
-
-		avg_volume = price_history['Volume'].rolling(30).mean().dropna().iloc[-1]
+async def fetch_with_timeout(fn, *args, **kwargs):
+	"""
+	Runs a blocking Yahoo fetch on the upstream executor, giving up after FETCH_TIMEOUT
+	seconds. Time spent queueing for a Yahoo slot doesn't count towards the timeout.
+	"""
+	return await run_upstream("yahoo", fn, *args, timeout=FETCH_TIMEOUT, **kwargs)
+
+async def _fetch_recommendation_inputs(ticker):
+	"""
+	Fetches everything one ticker's prediction needs: expirations, the chains
+	out to 45 days, the underlying price and 3 months of history.
+	Returns (inputs, None) on success or (None, error message).
+	"""
+	if not ticker:
+		return None, "Error: No stock symbol provided."
 
-		expected_move = str(round(straddle / underlying_price * 100,2)) + "%" if straddle else None
-
-		rating = -1
-
-		if avg_volume >= 1500000 and iv30_rv30 >= 1.25 and ts_slope_0_45 <= -0.00406:
-			rating = 1
-		elif avg_volume >= 1500000 and iv30_rv30 >= 1.25:
-			rating = 0
+	try:
+		exp_dates = list(await fetch_with_timeout(market_data.get_options, ticker))
+		if len(exp_dates) == 0:
+			raise KeyError()
+	except KeyError:
+		return None, f"Error: No options found for stock symbol '{ticker}'."
 
+	try:
+		exp_dates = filter_dates(exp_dates)
+	except:
+		return None, "Error: Not enough option data."
+
+	# Every chain and both history pulls are independent, so fetch them all at once
+	*chains, underlying_price, price_history = await asyncio.gather(
+		*(fetch_with_timeout(market_data.get_option_chain, ticker, exp_date) for exp_date in exp_dates),
+		fetch_with_timeout(get_current_price, ticker),
+		fetch_with_timeout(market_data.get_history, ticker, period='3mo'),
+		return_exceptions=True,
+	)
 
-		return {'message': "OK", 'avg_volume': avg_volume, 'iv30_rv30': iv30_rv30, 'ts_slope_0_45': ts_slope_0_45 , 'expected_move': expected_move, 'rating': rating}
+	try:
+		if isinstance(underlying_price, BaseException):
+			raise underlying_price
+		if underlying_price is None:
+			raise ValueError("No market price found.")
+	except Exception:
+		return None, "Error: Unable to retrieve underlying stock price."
+
+	for result in (*chains, price_history):
+		if isinstance(result, BaseException):
+			raise result
+
+	return {
+		'exp_dates': exp_dates,
+		'chains': chains,
+		'underlying_price': underlying_price,
+		'price_history': price_history,
+	}, None
+
+def _nearest_strike_position(strikes, price):
+	"""
+	Position of the strike closest to price, found with a binary search.
+	Ties go to the lower strike, matching (strikes - price).abs().idxmin() on a sorted chain.
+	"""
+	order = None
+	if np.any(np.diff(strikes) < 0):
+		order = np.argsort(strikes, kind='stable')
+		strikes = strikes[order]
+
+	i = int(np.searchsorted(strikes, price))
+	if i == len(strikes) or (i > 0 and price - strikes[i - 1] <= strikes[i] - price):
+		i -= 1
+	return int(order[i]) if order is not None else i
+
+def _atm_term_structure(inputs):
+	"""ATM IV per expiration as (days to expiry, iv) arrays, plus the front-month straddle price."""
+	today = datetime.today().date()
+	price = inputs['underlying_price']
+	dtes = []
+	ivs = []
+	straddle = None
+
+	for exp_date, chain in zip(inputs['exp_dates'], inputs['chains']):
+		calls = chain.calls
+		puts = chain.puts
+
+		if calls.empty or puts.empty:
+			continue
+
+		call = calls.iloc[_nearest_strike_position(calls['strike'].to_numpy(), price)]
+		put = puts.iloc[_nearest_strike_position(puts['strike'].to_numpy(), price)]
+
+		if not dtes:
+			if call['bid'] is not None and call['ask'] is not None and put['bid'] is not None and put['ask'] is not None:
+				straddle = (call['bid'] + call['ask']) / 2.0 + (put['bid'] + put['ask']) / 2.0
+
+		dtes.append((datetime.strptime(exp_date, "%Y-%m-%d").date() - today).days)
+		ivs.append((call['impliedVolatility'] + put['impliedVolatility']) / 2.0)
+
+	return np.array(dtes, dtype=float), np.array(ivs, dtype=float), straddle
+
+def evaluate_term_structures(term_structures, points):
+	"""
+	Evaluates many term structures at once with a single np.interp call.
+	term_structures is a list of (days, ivs) pairs and points is either one
+	array of query days shared by every structure or a (structures, points)
+	array. Values outside a structure's days are clamped to its end points,
+	the same as build_term_structure. Returns a (structures, points) array.
+	"""
+	points = np.broadcast_to(np.asarray(points, dtype=float), (len(term_structures), np.shape(points)[-1]))
+	if not term_structures:
+		return np.empty(points.shape)
+
+	# Shift every structure onto its own stretch of the x axis so one interpolation covers them all
+	span = max(days.max() - days.min() for days, _ in term_structures) + 1.0
+	xs, ys, queries = [], [], []
+	for n, (days, ivs) in enumerate(term_structures):
+		order = days.argsort()
+		offset = n * span - days.min()
+		xs.append(days[order] + offset)
+		ys.append(ivs[order])
+		queries.append(np.clip(points[n], days.min(), days.max()) + offset)
+
+	return np.interp(np.concatenate(queries), np.concatenate(xs), np.concatenate(ys)).reshape(points.shape)
+
+async def _recommendations(tickers, concurrency=8, rate=0):
+	"""Computes the prediction for every ticker. Returns {ticker: result dict} in input order."""
+	tickers = list(dict.fromkeys(ticker.strip().upper() for ticker in tickers))
+	semaphore = asyncio.Semaphore(concurrency)
+	limiter = RateLimiter(rate)
+
+	async def fetch(ticker):
+		async with semaphore:
+			await limiter.wait()
+			try:
+				return await _fetch_recommendation_inputs(ticker)
+			except Exception:
+				return None, 'Error: Error occured processing'
+
+	fetched = await asyncio.gather(*(fetch(ticker) for ticker in tickers))
+
+	results = {}
+	ready = []
+	for ticker, (inputs, error) in zip(tickers, fetched):
+		if error is not None:
+			results[ticker] = {'message': error}
+			continue
+		try:
+			dtes, ivs, straddle = _atm_term_structure(inputs)
+			if len(dtes) == 0:
+				results[ticker] = {'message': "Error: Could not determine ATM IV for any expiration dates."}
+				continue
+			ready.append((ticker, inputs, dtes, ivs, straddle))
+		except Exception:
+			results[ticker] = {'message': 'Error: Error occured processing'}
+
+	if ready:
+		# Term structures at (front expiry, 30d, 45d) for every ticker in one pass
+		front = np.array([dtes[0] for _, _, dtes, _, _ in ready])
+		curve = evaluate_term_structures(
+			[(dtes, ivs) for _, _, dtes, ivs, _ in ready],
+			np.column_stack([front, np.full(len(ready), 30.0), np.full(len(ready), 45.0)]),
+		)
+		ts_slopes = (curve[:, 2] - curve[:, 0]) / (45 - front)
+
+		# Yang-Zhang only needs the last window + 1 bars, so line every history up on those
+		window = 30
+		bars = np.full((len(ready), 4, window + 1), np.nan)
+		volumes = np.full((len(ready), window), np.nan)
+		for n, (_, inputs, _, _, _) in enumerate(ready):
+			history = inputs['price_history']
+			tail = history[['Open', 'High', 'Low', 'Close']].to_numpy()[-(window + 1):].T
+			bars[n, :, bars.shape[2] - tail.shape[1]:] = tail
+			volume = history['Volume'].to_numpy()[-window:]
+			volumes[n, volumes.shape[1] - len(volume):] = volume
+		realized_vol = yang_zhang_array(bars[:, 0], bars[:, 1], bars[:, 2], bars[:, 3], window=window)
+		iv30_rv30 = curve[:, 1] / realized_vol
+		avg_volumes = volumes.mean(axis=1)
+
+		for n, (ticker, inputs, _, _, straddle) in enumerate(ready):
+			avg_volume = avg_volumes[n]
+			if np.isnan(avg_volume):
+				# Gaps in the latest bars, fall back to the last complete 30 day window
+				rolling = inputs['price_history']['Volume'].rolling(30).mean().dropna()
+				if rolling.empty:
+					results[ticker] = {'message': 'Error: Error occured processing'}
+					continue
+				avg_volume = rolling.iloc[-1]
+
+			rating = -1
+			if avg_volume >= 1500000 and iv30_rv30[n] >= 1.25 and ts_slopes[n] <= -0.00406:
+				rating = 1
+			elif avg_volume >= 1500000 and iv30_rv30[n] >= 1.25:
+				rating = 0
+
+			underlying_price = inputs['underlying_price']
+			expected_move = str(round(straddle / underlying_price * 100,2)) + "%" if straddle else None
+
+			results[ticker] = {'message': "OK", 'avg_volume': avg_volume, 'iv30_rv30': iv30_rv30[n], 'ts_slope_0_45': ts_slopes[n], 'expected_move': expected_move, 'rating': rating}
+
+	return {ticker: results[ticker] for ticker in tickers}
+
+async def compute_recommendations(tickers, concurrency=8, rate=0):
+	"""
+	Batch version of compute_recommendation. Fetches the tickers' data
+	concurrently (at most `concurrency` at a time, `rate` starts per second),
+	then evaluates ATM strikes, term structures and realized volatility for
+	all of them together.
+	Returns a DataFrame indexed by ticker with the same fields as
+	compute_recommendation. Failed tickers only have an 'Error: ...' message.
+	"""
+	results = await _recommendations(tickers, concurrency, rate)
+	table = pd.DataFrame.from_dict(results, orient='index', columns=['message', 'avg_volume', 'iv30_rv30', 'ts_slope_0_45', 'expected_move', 'rating'])
+	table['rating'] = table['rating'].astype('Int64')
+	table.index.name = 'ticker'
+	return table
+
+async def compute_recommendation(ticker):
+	try:
+		results = await _recommendations([ticker])
+		return next(iter(results.values()))
 	except Exception as e:
-		return {'message': 'Error: Error occured processing'}
\ No newline at end of file
+		return {'message': 'Error: Error occured processing'}
@@ -0,0 +1,98 @@
+import os
+import asyncio
+import functools
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Max blocking calls allowed in flight at once against each upstream
+LIMITS = {
+	"yahoo": int(os.getenv("UPSTREAM_LIMIT_YAHOO", 16)),
+	"finnhub": int(os.getenv("UPSTREAM_LIMIT_FINNHUB", 4)),
+	"database": int(os.getenv("UPSTREAM_LIMIT_DATABASE", os.getenv("DB_POOL_MAX", 10))),
+}
+
+_executor = ThreadPoolExecutor(
+	max_workers=int(os.getenv("UPSTREAM_MAX_WORKERS", sum(LIMITS.values()))),
+	thread_name_prefix="upstream",
+)
+
+# asyncio semaphores belong to one event loop, so keep a set per loop
+_semaphores = weakref.WeakKeyDictionary()
+_active = {upstream: 0 for upstream in LIMITS}
+_waiting = {upstream: 0 for upstream in LIMITS}
+
+
+def _semaphore(upstream):
+	loop = asyncio.get_running_loop()
+	per_loop = _semaphores.setdefault(loop, {})
+	if upstream not in per_loop:
+		per_loop[upstream] = asyncio.Semaphore(LIMITS[upstream])
+	return per_loop[upstream]
+
+
+async def run_upstream(upstream, fn, *args, timeout=None, **kwargs):
+	"""
+	Runs a blocking call (yfinance, Finnhub, psycopg2) on the shared upstream
+	thread pool so the event loop stays free, waiting for a slot first if the
+	upstream already has LIMITS[upstream] calls in flight.
+	timeout (seconds) only counts the call itself, not the wait for a slot,
+	and raises asyncio.TimeoutError.
+	The slot is held until the call itself returns, even if the awaiting task
+	is cancelled first, since the thread keeps running either way.
+	"""
+	semaphore = _semaphore(upstream)
+	_waiting[upstream] += 1
+	try:
+		await semaphore.acquire()
+	finally:
+		_waiting[upstream] -= 1
+
+	loop = asyncio.get_running_loop()
+	_active[upstream] += 1
+	try:
+		future = _executor.submit(functools.partial(fn, *args, **kwargs))
+	except BaseException:
+		_release(upstream, semaphore)
+		raise
+	future.add_done_callback(lambda _: _release_threadsafe(loop, upstream, semaphore))
+	return await asyncio.wait_for(asyncio.wrap_future(future, loop=loop), timeout)
+
+
+def _release(upstream, semaphore):
+	_active[upstream] -= 1
+	semaphore.release()
+
+
+def _release_threadsafe(loop, upstream, semaphore):
+	# Done callbacks run on the worker thread, the semaphore belongs to the loop
+	try:
+		loop.call_soon_threadsafe(_release, upstream, semaphore)
+	except RuntimeError:
+		# The loop is already closed, nothing is waiting on its semaphore anymore
+		pass
+
+
+class RateLimiter:
+	"""Spaces calls out so that at most `rate` of them start per second (0 means unlimited)."""
+
+	def __init__(self, rate):
+		self.interval = 1.0 / rate if rate > 0 else 0.0
+		self._next_start = 0.0
+
+	async def wait(self):
+		if not self.interval:
+			return
+		now = asyncio.get_running_loop().time()
+		start = max(now, self._next_start)
+		self._next_start = start + self.interval
+		if start > now:
+			await asyncio.sleep(start - now)
+
+
+def upstream_stats():
+	return {
+		upstream: {"limit": LIMITS[upstream], "active": _active[upstream], "waiting": _waiting[upstream]}
+		for upstream in LIMITS
+	}
+
@@ -0,0 +1,254 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+
+import yfinance as yf
+try:
+	from yfinance.data import YfData
+except ImportError:
+	# Only batch quotes need it, everything else keeps working
+	YfData = None
+from utils import ohlcv_store
+
+
+def _env_seconds(name, default):
+	try:
+		return float(os.getenv(name, default))
+	except ValueError:
+		return float(default)
+
+
+# Seconds each kind of market data stays fresh before going back to Yahoo
+TTLS = {
+	"info": _env_seconds("MARKET_DATA_TTL_QUOTE", 15),
+	"quote": _env_seconds("MARKET_DATA_TTL_QUOTE", 15),
+	"history": _env_seconds("MARKET_DATA_TTL_HISTORY", 60),
+	"options": _env_seconds("MARKET_DATA_TTL_EXPIRATIONS", 3600),
+	"chain": _env_seconds("MARKET_DATA_TTL_CHAIN", 60),
+	"news": _env_seconds("MARKET_DATA_TTL_NEWS", 300),
+}
+
+
+class TTLCache:
+	"""
+	Thread-safe LRU cache where every entry expires after the TTL of its kind.
+	Keeps hit/miss counters per kind so we can tell how well it is working.
+	"""
+
+	def __init__(self, maxsize, ttls):
+		self.maxsize = maxsize
+		self.ttls = ttls
+		self.hits = {kind: 0 for kind in ttls}
+		self.misses = {kind: 0 for kind in ttls}
+		self.evictions = 0
+		self._data = OrderedDict()
+		self._lock = threading.Lock()
+
+	def get(self, kind, key):
+		"""Returns (True, value) for a fresh entry, (False, None) otherwise."""
+		now = time.monotonic()
+		with self._lock:
+			entry = self._data.get((kind, key))
+			if entry is not None:
+				expires_at, value = entry
+				if expires_at > now:
+					self._data.move_to_end((kind, key))
+					self.hits[kind] += 1
+					return True, value
+				del self._data[(kind, key)]
+			self.misses[kind] += 1
+			return False, None
+
+	def set(self, kind, key, value):
+		expires_at = time.monotonic() + self.ttls[kind]
+		with self._lock:
+			self._data[(kind, key)] = (expires_at, value)
+			self._data.move_to_end((kind, key))
+			while len(self._data) > self.maxsize:
+				self._data.popitem(last=False)
+				self.evictions += 1
+
+	def clear(self):
+		with self._lock:
+			self._data.clear()
+
+	def stats(self):
+		with self._lock:
+			return {
+				"size": len(self._data),
+				"maxsize": self.maxsize,
+				"evictions": self.evictions,
+				"hits": dict(self.hits),
+				"misses": dict(self.misses),
+			}
+
+
+class _Call:
+	def __init__(self):
+		self.done = threading.Event()
+		self.result = None
+		self.error = None
+
+
+class SingleFlight:
+	"""
+	Deduplicates concurrent calls for the same key: the first caller runs the
+	function, everyone who arrives while it is in flight waits and shares its
+	result (or its exception).
+	"""
+
+	def __init__(self):
+		self.calls = 0
+		self.shared = 0
+		self._inflight = {}
+		self._lock = threading.Lock()
+
+	def do(self, key, fn):
+		with self._lock:
+			call = self._inflight.get(key)
+			leader = call is None
+			if leader:
+				call = _Call()
+				self._inflight[key] = call
+				self.calls += 1
+			else:
+				self.shared += 1
+
+		if not leader:
+			call.done.wait()
+			if call.error is not None:
+				raise call.error
+			return call.result
+
+		try:
+			call.result = fn()
+		except BaseException as e:
+			call.error = e
+			raise
+		finally:
+			with self._lock:
+				del self._inflight[key]
+			call.done.set()
+		return call.result
+
+	def stats(self):
+		with self._lock:
+			return {"calls": self.calls, "shared": self.shared, "inflight": len(self._inflight)}
+
+
+_cache = TTLCache(int(os.getenv("MARKET_DATA_CACHE_SIZE", 1024)), TTLS)
+_flights = SingleFlight()
+
+
+def _cached(kind, key, loader):
+	hit, value = _cache.get(kind, key)
+	if hit:
+		return value
+
+	def load():
+		value = loader()
+		_cache.set(kind, key, value)
+		return value
+
+	return _flights.do((kind, key), load)
+
+
+def _symbol(ticker):
+	return ticker.strip().upper()
+
+
+def get_info(ticker):
+	"""Full quote/profile dict, the same as yf.Ticker(ticker).info."""
+	symbol = _symbol(ticker)
+	return _cached("info", (symbol,), lambda: yf.Ticker(symbol).info)
+
+
+# Yahoo's batch quote endpoint, the same one yfinance reads for the price fields of .info
+_QUOTE_URL = "https://query1.finance.yahoo.com/v7/finance/quote"
+QUOTE_BATCH_SIZE = 100
+
+
+def _fetch_quotes(symbols):
+	"""
+	Quotes for many symbols in one request per QUOTE_BATCH_SIZE, through yfinance's
+	shared session so the cookie and crumb are handled for us. Every quote is cached.
+	"""
+	data = YfData() if YfData is not None else None
+	if not hasattr(data, "get_raw_json"):
+		# Private yfinance API, see the pin in requirements.txt
+		raise RuntimeError(f"yfinance {yf.__version__} has no YfData.get_raw_json, batch quotes are unavailable")
+
+	quotes = {}
+	for i in range(0, len(symbols), QUOTE_BATCH_SIZE):
+		response = data.get_raw_json(_QUOTE_URL, params={"symbols": ",".join(symbols[i:i + QUOTE_BATCH_SIZE]), "formatted": "false"})
+		for quote in (response.get("quoteResponse") or {}).get("result") or []:
+			symbol = quote.get("symbol")
+			if symbol:
+				quotes[symbol] = quote
+				_cache.set("quote", (symbol,), quote)
+	return quotes
+
+
+def get_quotes(tickers):
+	"""
+	Price quotes (regular, pre- and post-market fields, as in .info) keyed by symbol.
+	Cached symbols are served as is, all the others come from one batched request.
+	Symbols Yahoo doesn't know are left out.
+	"""
+	symbols = list(dict.fromkeys(_symbol(ticker) for ticker in tickers))
+	quotes = {}
+	missing = []
+	for symbol in symbols:
+		hit, quote = _cache.get("quote", (symbol,))
+		if hit:
+			quotes[symbol] = quote
+		else:
+			missing.append(symbol)
+
+	if missing:
+		quotes.update(_flights.do(("quote", tuple(missing)), lambda: _fetch_quotes(missing)))
+	return {symbol: quotes[symbol] for symbol in symbols if symbol in quotes}
+
+
+def refresh_quotes(tickers):
+	"""Like get_quotes, but always asks Yahoo, e.g. for the streaming poller."""
+	symbols = list(dict.fromkeys(_symbol(ticker) for ticker in tickers))
+	return _flights.do(("quote", tuple(symbols)), lambda: _fetch_quotes(symbols))
+
+
+def get_history(ticker, **params):
+	"""
+	Price history, the same as yf.Ticker(ticker).history(**params), served from
+	the local OHLCV store which only pulls new bars from Yahoo.
+	The returned DataFrame is shared between callers, so don't modify it in place.
+	"""
+	symbol = _symbol(ticker)
+	key = (symbol, tuple(sorted(params.items())))
+	return _cached("history", key, lambda: ohlcv_store.read_history(symbol, **params))
+
+
+def get_options(ticker):
+	"""Option expiration dates as a tuple of 'YYYY-MM-DD' strings."""
+	symbol = _symbol(ticker)
+	return _cached("options", (symbol,), lambda: tuple(yf.Ticker(symbol).options))
+
+
+def get_option_chain(ticker, expiration):
+	"""
+	Option chain (calls, puts, underlying) for one expiration date.
+	The DataFrames are shared between callers, so don't modify them in place.
+	"""
+	symbol = _symbol(ticker)
+	return _cached("chain", (symbol, expiration), lambda: yf.Ticker(symbol).option_chain(expiration))
+
+
+def get_news(ticker):
+	symbol = _symbol(ticker)
+	return _cached("news", (symbol,), lambda: yf.Ticker(symbol).news)
+
+
+def cache_stats():
+	stats = _cache.stats()
+	stats["singleFlight"] = _flights.stats()
+	return stats
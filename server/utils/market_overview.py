@@ -0,0 +1,112 @@
+import os
+import time
+import asyncio
+from datetime import datetime, timezone
+from utils import market_data
+from utils.executor import run_upstream
+
+# Seconds between background refreshes of the index quotes
+REFRESH_SECONDS = float(os.getenv("MARKET_OVERVIEW_REFRESH_SECONDS", 15))
+
+# A snapshot older than this is refetched on request, e.g. when the background task isn't running
+MAX_AGE = float(os.getenv("MARKET_OVERVIEW_MAX_AGE", 120))
+
+INDEX_TICKERS = ["^GSPC", "^DJI", "^IXIC", "^RUT", "^VIX", "^TNX"]
+INDEX_NAMES = {
+	"^GSPC": "S&P 500",
+	"^DJI": "Dow Jones",
+	"^IXIC": "Nasdaq",
+	"^RUT": "Russell 2000",
+	"^VIX": "VIX",
+	"^TNX": "10-Yr Treasury",
+}
+
+_snapshot = None
+_refreshed_at = None
+_lock = None
+_task = None
+
+
+def format_quote(quote: dict, name_override: str = None) -> dict:
+	"""Formats a single quote from yahoo-finance2 consistently."""
+	change = quote.get("regularMarketChange")
+	percent_change = quote.get("regularMarketChangePercent")
+	is_positive = change >= 0 if change is not None else False
+
+	if quote.get("symbol") == "^TNX":
+		value = f"{quote.get('regularMarketPrice'):.2f}%" if quote.get('regularMarketPrice') is not None else None
+	else:
+		value = f"{quote.get('regularMarketPrice'):.2f}" if quote.get('regularMarketPrice') is not None else None
+
+	formatted_quote = {
+		"name": name_override or quote.get("shortName") or quote.get("symbol"),
+		"symbol": quote.get("symbol"),
+		"value": value,
+		"change": f"{change:.2f}" if change is not None else None,
+		"percentChange": f"{'+' if is_positive else ''}{percent_change:.2f}%" if percent_change is not None else None,
+		"isPositive": is_positive,
+	}
+	return formatted_quote
+
+
+async def refresh():
+	"""Fetches the index quotes and replaces the in-memory snapshot."""
+	global _snapshot, _refreshed_at
+	quotes = await asyncio.gather(*(run_upstream("yahoo", market_data.get_info, ticker) for ticker in INDEX_TICKERS))
+	_snapshot = {
+		"indices": [format_quote(q, INDEX_NAMES.get(q.get("symbol"))) for q in quotes if q is not None and q.get('symbol')],
+		"asOf": datetime.now(timezone.utc).isoformat(),
+	}
+	_refreshed_at = time.monotonic()
+
+
+async def _refresh_loop():
+	while True:
+		try:
+			await refresh()
+		except Exception as e:
+			# Keep serving the previous snapshot and try again next round
+			print(f"Failed to refresh market overview: {e}")
+		await asyncio.sleep(REFRESH_SECONDS)
+
+
+def start():
+	"""Starts the background refresh on the running event loop."""
+	global _task
+	if _task is None or _task.done():
+		_task = asyncio.get_running_loop().create_task(_refresh_loop())
+
+
+async def stop():
+	global _task
+	if _task is not None:
+		_task.cancel()
+		try:
+			await _task
+		except asyncio.CancelledError:
+			pass
+		_task = None
+
+
+def snapshot_age():
+	return None if _refreshed_at is None else time.monotonic() - _refreshed_at
+
+
+async def get_snapshot():
+	"""
+	The latest formatted index quotes plus their age in seconds. Served from
+	memory, only fetched here when there is no snapshot yet or it is older than MAX_AGE.
+	"""
+	global _lock
+	if _lock is None:
+		_lock = asyncio.Lock()
+
+	age = snapshot_age()
+	if age is None or age > MAX_AGE:
+		async with _lock:
+			# Another request may have refreshed it while this one waited
+			age = snapshot_age()
+			if age is None or age > MAX_AGE:
+				await refresh()
+
+	return {**_snapshot, "ageSeconds": round(snapshot_age(), 3)}
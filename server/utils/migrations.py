@@ -0,0 +1,105 @@
+import os
+import re
+
+# server/migrations, one NNNN_description.sql file per schema version
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "migrations")
+
+# Held while migrating so several workers starting at once apply each migration only once
+LOCK_KEY = 7215030214
+
+# Indexes the hot queries rely on, checked after migrating
+REQUIRED_INDEXES = {
+	"earnings_ticker_key": "earnings",
+	"earnings_date_timing_idx": "earnings",
+	"earnings_date_ticker_idx": "earnings",
+	"earnings_rating_ticker_idx": "earnings",
+}
+
+class MissingIndexesError(RuntimeError):
+	"""The database is reachable but some of REQUIRED_INDEXES don't exist."""
+
+	def __init__(self, missing):
+		self.missing = missing
+		super().__init__(f"Missing database indexes: {', '.join(missing)}")
+
+
+_FILENAME = re.compile(r"^(\d{4})_(\w+)\.sql$")
+
+
+def available_migrations():
+	"""(version, name, path) of every migration file, oldest first."""
+	migrations = []
+	for filename in os.listdir(MIGRATIONS_DIR):
+		match = _FILENAME.match(filename)
+		if match:
+			migrations.append((int(match.group(1)), match.group(2), os.path.join(MIGRATIONS_DIR, filename)))
+	return sorted(migrations)
+
+
+def migrate(conn):
+	"""
+	Applies the migrations that haven't run yet, each in its own transaction,
+	and records them in schema_migrations. Returns the names of the ones applied.
+	"""
+	cursor = conn.cursor()
+	applied = []
+	cursor.execute("SELECT pg_advisory_lock(%s)", (LOCK_KEY,))
+	try:
+		cursor.execute("""
+			CREATE TABLE IF NOT EXISTS schema_migrations (
+				version INTEGER PRIMARY KEY,
+				name TEXT NOT NULL,
+				applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+			)
+		""")
+		conn.commit()
+
+		# Read after taking the lock, another worker may have just migrated
+		cursor.execute("SELECT version FROM schema_migrations")
+		done = {row[0] for row in cursor.fetchall()}
+
+		for version, name, path in available_migrations():
+			if version in done:
+				continue
+			with open(path) as f:
+				cursor.execute(f.read())
+			cursor.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)", (version, name))
+			conn.commit()
+			applied.append(f"{version:04d}_{name}")
+			print(f"Applied migration {version:04d}_{name}")
+		return applied
+	except Exception:
+		conn.rollback()
+		raise
+	finally:
+		cursor.execute("SELECT pg_advisory_unlock(%s)", (LOCK_KEY,))
+		conn.commit()
+		cursor.close()
+
+
+def verify_indexes(conn):
+	"""Raises if any of REQUIRED_INDEXES is missing, e.g. after a migration was edited by hand."""
+	cursor = conn.cursor()
+	try:
+		cursor.execute("SELECT indexname FROM pg_indexes WHERE indexname = ANY(%s)", (list(REQUIRED_INDEXES),))
+		found = {row[0] for row in cursor.fetchall()}
+	finally:
+		cursor.close()
+		conn.rollback()
+
+	missing = [f"{table}.{index}" for index, table in REQUIRED_INDEXES.items() if index not in found]
+	if missing:
+		raise MissingIndexesError(missing)
+
+
+if __name__ == "__main__":
+	# Run from server/: python -m utils.migrations
+	from dotenv import load_dotenv
+	from utils import database
+
+	load_dotenv()
+	database.init_pool()
+	with database.pooled_connection() as conn:
+		print(migrate(conn) or "Nothing to migrate")
+		verify_indexes(conn)
+	database.close_pool()
@@ -0,0 +1,211 @@
+import os
+import re
+import json
+import time
+import tempfile
+import threading
+import pandas as pd
+import yfinance as yf
+
+# Where the per ticker/interval Parquet files live
+STORE_DIR = os.getenv("OHLCV_STORE_DIR", os.path.join("data", "ohlcv"))
+
+# Seconds before a stored series is topped up from Yahoo again
+REFRESH_SECONDS = float(os.getenv("OHLCV_REFRESH_SECONDS", 60))
+
+# Yahoo only serves intraday bars this far back, so older tails need a full refetch
+INTRADAY_LOOKBACK = {
+	"1m": pd.Timedelta(days=7),
+	"2m": pd.Timedelta(days=60),
+	"5m": pd.Timedelta(days=60),
+	"15m": pd.Timedelta(days=60),
+	"30m": pd.Timedelta(days=60),
+	"60m": pd.Timedelta(days=730),
+	"90m": pd.Timedelta(days=60),
+	"1h": pd.Timedelta(days=730),
+}
+
+_PERIOD = re.compile(r"^(\d+)(d|wk|mo|y)$")
+
+# One lock per (ticker, interval), so concurrent reads of a series share one download
+_locks = {}
+_locks_guard = threading.Lock()
+
+
+def _series_lock(ticker, interval):
+	with _locks_guard:
+		return _locks.setdefault((ticker, interval), threading.Lock())
+
+
+def _paths(ticker, interval):
+	folder = os.path.join(STORE_DIR, interval)
+	name = ticker.replace("/", "_")
+	return folder, os.path.join(folder, f"{name}.parquet"), os.path.join(folder, f"{name}.json")
+
+
+def _load(ticker, interval):
+	"""Stored bars and their metadata, or (None, None) if nothing usable is on disk."""
+	_, data_path, meta_path = _paths(ticker, interval)
+	try:
+		with open(meta_path) as f:
+			meta = json.load(f)
+		return pd.read_parquet(data_path), meta
+	except (OSError, ValueError):
+		return None, None
+
+
+def _save(ticker, interval, history, meta):
+	folder, data_path, meta_path = _paths(ticker, interval)
+	try:
+		os.makedirs(folder, exist_ok=True)
+		# Write to a temp file and rename so other workers never read a half-written file
+		fd, tmp_path = tempfile.mkstemp(dir=folder, suffix=".tmp")
+		os.close(fd)
+		history.to_parquet(tmp_path)
+		os.replace(tmp_path, data_path)
+		fd, tmp_path = tempfile.mkstemp(dir=folder, suffix=".tmp")
+		with os.fdopen(fd, "w") as f:
+			json.dump(meta, f)
+		os.replace(tmp_path, meta_path)
+	except OSError as e:
+		print(f"Failed to write OHLCV store for {ticker} {interval}: {e}")
+
+
+def _period_start(period, now):
+	"""Earliest timestamp a yfinance period reaches back to, or None for 'max'."""
+	if period == "max":
+		return None
+	if period == "ytd":
+		return pd.Timestamp(year=now.year, month=1, day=1, tz="UTC")
+	match = _PERIOD.match(period)
+	if not match:
+		raise ValueError(f"Unsupported period '{period}'")
+	count, unit = int(match.group(1)), match.group(2)
+	if unit == "d":
+		# Leave room for weekends and holidays, the slice below counts sessions exactly
+		return now - pd.Timedelta(days=count + 4)
+	if unit == "wk":
+		return now - pd.Timedelta(weeks=count)
+	if unit == "mo":
+		return now - pd.DateOffset(months=count)
+	return now - pd.DateOffset(years=count)
+
+
+def _covers(meta, start):
+	if meta.get("covered_from") is None:
+		return True
+	return start is not None and pd.Timestamp(meta["covered_from"]) <= start
+
+
+def _slice(history, period, start, end, now):
+	if start is not None and period is None:
+		mask = history.index >= _localize(start, history.index)
+		if end is not None:
+			mask &= history.index < _localize(end, history.index)
+		return history[mask]
+
+	if period == "max":
+		return history
+
+	match = _PERIOD.match(period)
+	if match and match.group(2) == "d":
+		# 'Nd' means the last N trading sessions, not N calendar days
+		sessions = history.index.normalize().unique()[-int(match.group(1)):]
+		return history[history.index.normalize().isin(sessions)]
+
+	return history[history.index >= _localize(_period_start(period, now), history.index)]
+
+
+def _localize(ts, index):
+	ts = pd.Timestamp(ts)
+	if index.tz is None:
+		return ts.tz_localize(None) if ts.tz is not None else ts
+	return ts.tz_localize(index.tz) if ts.tz is None else ts.tz_convert(index.tz)
+
+
+def _has_corporate_action(history):
+	for column in ("Dividends", "Stock Splits"):
+		if column in history and (history[column].fillna(0) != 0).any():
+			return True
+	return False
+
+
+def read_history(ticker, period=None, interval="1d", start=None, end=None):
+	"""
+	Drop-in for yf.Ticker(ticker).history(period=..., interval=..., start=..., end=...)
+	backed by a Parquet file per ticker and interval. Only the bars after the
+	last stored one are fetched from Yahoo, at most every REFRESH_SECONDS, and
+	the requested range is answered from disk.
+	"""
+	if period is None and start is None:
+		period = "1mo"
+
+	now = pd.Timestamp.now(tz="UTC")
+	requested_start = _period_start(period, now) if period is not None else pd.Timestamp(start, tz="UTC")
+
+	# Held across load, fetch and save: a caller that waited finds the series
+	# the previous one just stored and slices its own range from it
+	with _series_lock(ticker, interval):
+		stored, meta = _load(ticker, interval)
+
+		if stored is None or stored.empty or not _covers(meta, requested_start):
+			stored = _fetch_full(ticker, period, interval, requested_start, now)
+		elif time.time() - meta["fetched_at"] >= REFRESH_SECONDS:
+			stored = _append_tail(ticker, interval, stored, meta, now)
+
+	if stored.empty:
+		return stored
+	return _slice(stored, period, start, end, now)
+
+
+def _fetch_full(ticker, period, interval, requested_start, now):
+	"""Downloads everything from requested_start (None for 'max') and replaces the stored series."""
+	if interval not in INTRADAY_LOOKBACK and requested_start is not None and requested_start > now - pd.DateOffset(years=1):
+		# Daily and slower bars are cheap, so grab at least a year to serve later ranges from disk
+		requested_start = now - pd.DateOffset(years=1)
+
+	covered_from = requested_start
+	if requested_start is None:
+		history = yf.Ticker(ticker).history(period="max", interval=interval)
+	elif interval in INTRADAY_LOOKBACK and period is not None:
+		history = yf.Ticker(ticker).history(period=period, interval=interval)
+		# 'Nd' only downloads N sessions, less than requested_start's padded window
+		if not history.empty:
+			covered_from = history.index[0].tz_convert("UTC")
+	else:
+		history = yf.Ticker(ticker).history(start=requested_start.strftime('%Y-%m-%d'), interval=interval)
+
+	if not history.empty:
+		_save(ticker, interval, history, {
+			"covered_from": None if covered_from is None else covered_from.isoformat(),
+			"fetched_at": time.time(),
+		})
+	return history
+
+
+def _append_tail(ticker, interval, stored, meta, now):
+	"""Fetches the bars from the last stored session onward and merges them in."""
+	covered_from = None if meta["covered_from"] is None else pd.Timestamp(meta["covered_from"])
+	last_bar = stored.index[-1]
+	lookback = INTRADAY_LOOKBACK.get(interval)
+	if lookback is not None and now - last_bar >= lookback:
+		restart = now - lookback + pd.Timedelta(days=1)
+		return _fetch_full(ticker, None, interval, restart if covered_from is None else max(covered_from, restart), now)
+
+	tail = yf.Ticker(ticker).history(start=last_bar.strftime('%Y-%m-%d'), interval=interval)
+
+	if _has_corporate_action(tail[tail.index > last_bar]):
+		# Yahoo back-adjusts older bars after splits and dividends, so the stored ones are stale now
+		return _fetch_full(ticker, None, interval, covered_from, now)
+
+	if not tail.empty:
+		# Re-fetched bars replace stored ones, the last stored bar may have been incomplete
+		stored = pd.concat([stored[stored.index < tail.index[0]], tail])
+		if lookback is not None:
+			stored = stored[stored.index > now - lookback]
+			first_bar = stored.index[0].tz_convert("UTC")
+			meta["covered_from"] = (first_bar if covered_from is None else max(covered_from, first_bar)).isoformat()
+
+	meta["fetched_at"] = time.time()
+	_save(ticker, interval, stored, meta)
+	return stored
@@ -0,0 +1,99 @@
+import os
+import math
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+from psycopg2.extras import Json
+from utils import database
+from utils.earnings import compute_recommendation
+from utils.executor import run_upstream
+
+# How long a stored prediction is served before it gets recomputed
+TTL = float(os.getenv("PREDICTION_CACHE_TTL", 300))
+
+MARKET_TZ = ZoneInfo("America/New_York")
+
+
+def trading_session(now=None):
+	"""The trading day a moment belongs to, in New York time. Weekends map back to Friday."""
+	day = (now or datetime.now(timezone.utc)).astimezone(MARKET_TZ).date()
+	while day.weekday() >= 5:
+		day -= timedelta(days=1)
+	return day
+
+
+def _load(ticker, session):
+	with database.pooled_connection() as conn:
+		cursor = conn.cursor()
+		try:
+			cursor.execute(
+				"SELECT payload, as_of FROM prediction_cache WHERE ticker = %s AND session_date = %s AND as_of > now() - make_interval(secs => %s)",
+				(ticker, session, TTL),
+			)
+			return cursor.fetchone()
+		finally:
+			cursor.close()
+			conn.rollback()
+
+
+def _store(ticker, session, payload):
+	with database.pooled_connection() as conn:
+		cursor = conn.cursor()
+		try:
+			cursor.execute(
+				"INSERT INTO prediction_cache (ticker, session_date, payload, as_of) VALUES (%s, %s, %s, now()) "
+				"ON CONFLICT (ticker, session_date) DO UPDATE SET payload = EXCLUDED.payload, as_of = EXCLUDED.as_of "
+				"RETURNING as_of",
+				(ticker, session, Json(payload)),
+			)
+			as_of = cursor.fetchone()[0]
+			conn.commit()
+			return as_of
+		except Exception:
+			conn.rollback()
+			raise
+		finally:
+			cursor.close()
+
+
+def purge_sessions_before(conn, session):
+	cursor = conn.cursor()
+	try:
+		cursor.execute("DELETE FROM prediction_cache WHERE session_date < %s", (session,))
+		conn.commit()
+	finally:
+		cursor.close()
+
+
+def _json_safe(prediction):
+	# JSONB has no NaN, store it as null
+	return {key: None if isinstance(value, float) and math.isnan(value) else value for key, value in prediction.items()}
+
+
+async def cached_recommendation(ticker):
+	"""
+	compute_recommendation backed by the prediction_cache table, so results are
+	shared across workers and survive restarts. Successful predictions are reused
+	for PREDICTION_CACHE_TTL seconds within the same trading session.
+	Every response carries an ISO 8601 'as_of' timestamp of when it was computed.
+	"""
+	ticker = ticker.strip().upper()
+	session = trading_session()
+
+	try:
+		row = await run_upstream("database", _load, ticker, session)
+		if row is not None:
+			payload, as_of = row
+			return {**payload, 'as_of': as_of.isoformat()}
+	except Exception as e:
+		print(f"Failed to read prediction cache for {ticker}: {e}")
+
+	prediction = _json_safe(await compute_recommendation(ticker))
+	as_of = datetime.now(timezone.utc)
+
+	if prediction['message'] == "OK":
+		try:
+			as_of = await run_upstream("database", _store, ticker, session, prediction)
+		except Exception as e:
+			print(f"Failed to write prediction cache for {ticker}: {e}")
+
+	return {**prediction, 'as_of': as_of.isoformat()}
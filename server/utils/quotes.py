@@ -0,0 +1,129 @@
+import os
+import asyncio
+from utils import market_data
+from utils.executor import run_upstream
+
+# Seconds between upstream polls of every subscribed ticker
+STREAM_INTERVAL = float(os.getenv("QUOTE_STREAM_INTERVAL", 5))
+
+# Updates buffered per subscriber, a slow client only ever misses the oldest ones
+QUEUE_SIZE = 64
+
+
+def price_update(info):
+	"""The last, pre- and post-market price fields of a quote, as /currentPrice returns them."""
+	prev_close = info.get("regularMarketPrice")
+	prev_close_percent = round(info.get("regularMarketChangePercent"), ndigits=2)
+
+	if 'postMarketPrice' in info:
+		post_price = info.get("postMarketPrice")
+		post_price_percent = round(info.get("postMarketChangePercent"), ndigits=2)
+
+		return {
+			"post_price": post_price,
+			"post_price_percent": post_price_percent,
+			"last_price": prev_close,
+			"last_price_percent": prev_close_percent,
+			"source": "after-hours"
+		}
+
+	elif "preMarketPrice" in info:
+
+		pre_price = info.get("preMarketPrice")
+		pre_price_percent = round(info.get("preMarketChangePercent"), ndigits=2)
+		return {
+			"pre_price": pre_price,
+			"pre_price_percent": pre_price_percent,
+			"last_price": prev_close,
+			"last_price_percent": prev_close_percent,
+			"source": "before-hours"
+		}
+	else:
+		return {
+			"last_price": prev_close,
+			"last_price_percent": prev_close_percent,
+			"source": "during-hours"
+		}
+
+
+def quote_update(symbol, quote):
+	"""price_update for one symbol tagged with it, or None when there is no usable quote."""
+	if quote is None:
+		return None
+	try:
+		return {"symbol": symbol, **price_update(quote)}
+	except (TypeError, ValueError):
+		# Quotes without a change percent, e.g. delisted or unknown tickers
+		return None
+
+
+class QuoteHub:
+	"""
+	Fans quote updates out to streaming clients. A single poller fetches every
+	subscribed ticker once per interval, however many clients watch it, and
+	pushes changed quotes onto each subscriber's queue. Tickers nobody watches
+	anymore drop out of the poll set, and the poller stops when there are none.
+	"""
+
+	def __init__(self, interval):
+		self.interval = interval
+		self._subscribers = {}
+		self._latest = {}
+		self._task = None
+
+	def subscribe(self, symbols):
+		"""Returns a queue receiving updates for symbols, primed with the latest known quotes."""
+		queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+		for symbol in symbols:
+			self._subscribers.setdefault(symbol, set()).add(queue)
+			if symbol in self._latest:
+				self._put(queue, self._latest[symbol])
+
+		if self._task is None or self._task.done():
+			self._task = asyncio.get_running_loop().create_task(self._poll())
+		return queue
+
+	def unsubscribe(self, queue, symbols):
+		for symbol in symbols:
+			subscribers = self._subscribers.get(symbol)
+			if subscribers is None:
+				continue
+			subscribers.discard(queue)
+			if not subscribers:
+				del self._subscribers[symbol]
+				self._latest.pop(symbol, None)
+
+	async def _poll(self):
+		while self._subscribers:
+			symbols = list(self._subscribers)
+			try:
+				# Every watched ticker in one upstream round trip
+				fetched = await run_upstream("yahoo", market_data.refresh_quotes, symbols)
+			except Exception as e:
+				print(f"Failed to poll quotes for {', '.join(symbols)}: {e}")
+				fetched = {}
+
+			for symbol in symbols:
+				update = quote_update(symbol, fetched.get(symbol))
+				if update is None or symbol not in self._subscribers or update == self._latest.get(symbol):
+					continue
+				self._latest[symbol] = update
+				for queue in self._subscribers[symbol]:
+					self._put(queue, update)
+			await asyncio.sleep(self.interval)
+
+	@staticmethod
+	def _put(queue, update):
+		if queue.full():
+			queue.get_nowait()
+		queue.put_nowait(update)
+
+	def stats(self):
+		return {
+			"tickers": len(self._subscribers),
+			"subscribers": len({id(queue) for queues in self._subscribers.values() for queue in queues}),
+			"polling": self._task is not None and not self._task.done(),
+		}
+
+
+hub = QuoteHub(STREAM_INTERVAL)
@@ -0,0 +1,128 @@
+import hashlib
+from decimal import Decimal
+import numpy as np
+import pandas as pd
+import orjson
+import pyarrow as pa
+from fastapi.responses import JSONResponse, Response
+
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+
+
+def _records(df):
+	"""
+	A DataFrame as a list of row dicts, built column by column from arrays.
+	Floats stay Python floats, which orjson writes in shortest round-trip form
+	with NaN/inf as null. Datetimes become ISO 8601 strings.
+	"""
+	columns = []
+	for name in df.columns:
+		series = df[name]
+		if pd.api.types.is_datetime64_any_dtype(series.dtype):
+			values = [None if ts is pd.NaT else ts.isoformat() for ts in series]
+		elif pd.api.types.is_float_dtype(series.dtype):
+			values = series.to_numpy(dtype=float).tolist()
+		else:
+			values = series.astype(object).where(series.notna(), None).tolist()
+		columns.append(values)
+	names = [str(name) for name in df.columns]
+	return [dict(zip(names, row)) for row in zip(*columns)]
+
+
+def _default(obj):
+	"""Encodes what orjson doesn't handle natively."""
+	if obj is pd.NaT or obj is pd.NA:
+		return None
+	if isinstance(obj, pd.Timestamp):
+		return obj.isoformat()
+	if isinstance(obj, pd.DataFrame):
+		return _records(obj)
+	if isinstance(obj, (pd.Series, pd.Index)):
+		return obj.tolist()
+	if isinstance(obj, np.ndarray):
+		return obj.tolist()
+	if isinstance(obj, np.generic):
+		return obj.item()
+	if isinstance(obj, Decimal):
+		return float(obj)
+	if isinstance(obj, (set, frozenset)):
+		return list(obj)
+	raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class FastJSONResponse(JSONResponse):
+	"""
+	JSONResponse rendered with orjson. NumPy arrays and scalars, pandas
+	DataFrames, Series and Timestamps, datetimes and Decimals are encoded
+	directly, and NaN/inf become null instead of failing the response.
+	DataFrames are written as a list of records.
+	Return it from a handler to skip FastAPI's jsonable_encoder pass; being the
+	app's default_response_class is not enough, handlers returning plain dicts
+	still go through jsonable_encoder, which fails on NumPy scalars.
+	"""
+
+	def render(self, content) -> bytes:
+		return orjson.dumps(content, default=_default, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+
+
+def wants_arrow(request):
+	"""True when the client asked for an Arrow IPC stream in its Accept header."""
+	return ARROW_STREAM in request.headers.get("accept", "")
+
+
+def with_metadata(table, metadata):
+	"""Adds metadata to a table's schema as string key/value pairs, next to what's already there."""
+	return table.replace_schema_metadata({
+		**(table.schema.metadata or {}),
+		**{str(key).encode(): str(value).encode() for key, value in metadata.items()},
+	})
+
+
+def arrow_table(df, metadata=None):
+	"""Converts a DataFrame column by column into an Arrow table, without going through rows."""
+	table = pa.Table.from_pandas(df, preserve_index=False)
+	return with_metadata(table, metadata) if metadata else table
+
+
+class ArrowResponse(Response):
+	"""
+	Writes a pyarrow Table as an Arrow IPC stream, so clients can load it with
+	pyarrow.ipc.open_stream(...).read_all() instead of parsing JSON records.
+	"""
+	media_type = ARROW_STREAM
+
+	def __init__(self, content, status_code=200, headers=None, **kwargs):
+		super().__init__(content, status_code=status_code, headers={"Vary": "Accept", **(headers or {})}, **kwargs)
+
+	def render(self, content) -> bytes:
+		sink = pa.BufferOutputStream()
+		with pa.ipc.new_stream(sink, content.schema) as writer:
+			writer.write_table(content)
+		return sink.getvalue().to_pybytes()
+
+
+def _etag_matches(if_none_match, etag):
+	if if_none_match.strip() == "*":
+		return True
+	# Weak comparison, W/ prefixes are ignored on both sides
+	tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+	return etag.removeprefix("W/") in tags
+
+
+def with_etag(request, response):
+	"""
+	Tags a rendered response with a weak ETag hashed from its body. When the
+	client's If-None-Match already has that tag, an empty 304 goes back instead.
+	The tag is weak so it stays valid after the gzip middleware re-encodes the body.
+	"""
+	etag = f'W/"{hashlib.blake2b(response.body, digest_size=16).hexdigest()}"'
+	headers = {"ETag": etag, "Cache-Control": "no-cache"}
+	if "vary" in response.headers:
+		headers["Vary"] = response.headers["vary"]
+
+	if_none_match = request.headers.get("if-none-match")
+	if if_none_match and _etag_matches(if_none_match, etag):
+		return Response(status_code=304, headers=headers)
+
+	response.headers.update(headers)
+	return response